@@ -1,21 +1,26 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
 from dateutil.relativedelta import relativedelta
 from django.utils.html import format_html
 from django.urls import path, reverse
-from django.http import HttpResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from urllib.parse import urlparse
-from zipfile import ZipFile
 from .models import *
-from .views import ProjectsViewSet, SpeakersViewSet, ScriptsViewSet
+from .bundles import bundle_zip, bundles, projects
 from .forms import ProjectAdminForm
 from .filters import *
 from speech_recording import settings
 from celery import current_app
+from reports.locks import archive_lock
 from .forms import ArchiveForm
+from .zipstream import stream_zip
 import datetime
 import csv
-import io
+
+# The single project download is sent in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 
 class ProjectPermissionMixin:
@@ -63,7 +68,7 @@ class RecPromptAdmin(OtherPermissionMixin, RecordingMixin, admin.ModelAdmin):
     list_display = ("__str__", "script", "project")
     list_filter = (ProjectFilter, RecordedFilter)
     search_fields = ("mediaitem",)
-    readonly_fields = ("_recording", "filesize")
+    readonly_fields = ("_recording", "filesize", "sha256")
     exclude = ("recording",)
 
     def project(self, obj):
@@ -72,7 +77,7 @@ class RecPromptAdmin(OtherPermissionMixin, RecordingMixin, admin.ModelAdmin):
 
     def get_queryset(self, *args, **kwargs):
         qs = super().get_queryset(*args, **kwargs)
-        return qs.select_related("script__project")
+        return qs.select_related("script__project__speaker")
 
 
 class RecPromptInline(RecordingMixin, admin.TabularInline):
@@ -84,8 +89,8 @@ class RecPromptInline(RecordingMixin, admin.TabularInline):
 @admin.register(Script)
 class ScriptAdmin(OtherPermissionMixin, admin.ModelAdmin):
     def recorded(self, obj=None):
-        if obj and obj.recprompts.filter(recording__gt=""):
-            return True
+        if obj:
+            return obj.has_recordings
         return False
 
     recorded.boolean = True
@@ -115,8 +120,11 @@ class ScriptAdmin(OtherPermissionMixin, admin.ModelAdmin):
             if url.path.startswith("/admin/recordings/project/"):
                 qs = qs.filter(project__isnull=True)
 
-        return qs.select_related("project", "project__speaker").only(
-            "project__session", "project__speaker__name"
+        recordings = RecPrompt.objects.filter(script=OuterRef("pk"), recording__gt="")
+        return (
+            qs.select_related("project", "project__speaker")
+            .only("project__session", "project__speaker__name")
+            .annotate(has_recordings=Exists(recordings))
         )
 
 
@@ -130,33 +138,59 @@ class ProjectAdmin(ProjectPermissionMixin, admin.ModelAdmin):
     model = Project
     form = ProjectAdminForm
     change_list_template = "admin/recordings/project/change_list.html"
+    actions = ("download_projects",)
 
-    def download(self, *args, **kwargs):
-        project = Project.objects.get(pk=kwargs.get("pk"))
-
-        project_view = ProjectsViewSet.as_view({"get": "retrieve"})
-        speaker_view = SpeakersViewSet.as_view({"get": "retrieve"})
-        script_view = ScriptsViewSet.as_view({"get": "retrieve"})
+    def stream_bundles(self, filename, chunks):
+        response = StreamingHttpResponse(
+            chunks, content_type="application/x-zip-compressed"
+        )
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
 
-        project_xml = project_view(*args, **kwargs).render()
-        speaker_xml = speaker_view(*args, **{"pk": project.speaker.pk}).render()
-        script_xml = script_view(*args, **{"pk": project.script.pk}).render()
-        dtd_file = os.path.join(settings.STATIC_ROOT, "SpeechRecPrompts_4.dtd")
+    def download(self, request, *args, **kwargs):
+        """
+        Stream a project's session files from the cached zip. The zip is
+        cached as one value, so it is held whole while it is sent, which is
+        deliberate: it holds only XML, a few hundred KB for a long script.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        visible = self.get_queryset(request).values("pk")
+        project = get_object_or_404(
+            projects().filter(pk__in=visible), pk=kwargs.get("pk")
+        )
+        content = bundle_zip(project)
+        return self.stream_bundles(
+            f"{project.name}.zip",
+            (
+                content[i : i + DOWNLOAD_CHUNK_SIZE]
+                for i in range(0, len(content), DOWNLOAD_CHUNK_SIZE)
+            ),
+        )
 
-        buffer = io.BytesIO()
+    def download_many(self, request, *args, **kwargs):
+        """
+        Stream the session files of every project in the pk query parameter,
+        each in a folder of its own, rendering one project at a time
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
 
-        with ZipFile(buffer, "w") as zf:
-            zf.writestr(f"{project.name}_project.prj", project_xml.content)
-            zf.writestr(f"{project.speaker.pk}_speakers.xml", speaker_xml.content)
-            zf.writestr(f"{project.script.pk}_script.xml", script_xml.content)
-            zf.write(dtd_file, arcname="SpeechRecPrompts_4.dtd")
+        pks = [pk for pk in request.GET.get("pk", "").split(",") if pk.isdigit()]
+        pks = self.get_queryset(request).filter(pk__in=pks).values_list("pk", flat=True)
+        return self.stream_bundles("projects.zip", stream_zip(bundles(pks)))
 
-        response = HttpResponse(buffer.getvalue())
-        response["Content-Type"] = "application/x-zip-compressed"
-        response["Content-Disposition"] = f"attachment; filename={project.name}.zip"
-        return response
+    @admin.action(description="Download selected projects")
+    def download_projects(self, request, queryset):
+        # Redirect to a download that can be linked to and retried
+        pks = ",".join(str(pk) for pk in queryset.values_list("pk", flat=True))
+        return HttpResponseRedirect(f"download/?pk={pks}")
 
     def archive(self, request, *args, **kwargs):
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+
         context = {
             "opts": self.model._meta,
             "site_title": "Speech Recorder admin",
@@ -172,24 +206,29 @@ class ProjectAdmin(ProjectPermissionMixin, admin.ModelAdmin):
                 start = form.cleaned_data.get("start")
                 end = form.cleaned_data.get("end")
                 language = form.cleaned_data.get("language")
-
-                i = current_app.control.inspect()
-
-                for worker, tasks in i.active().items():
-                    for task in tasks:
-                        if task["name"] == "Create archive":
-                            self.message_user(
-                                request,
-                                "Create archive task is already running",
-                                level="ERROR",
-                            )
-                            return render(
-                                request,
-                                "admin/recordings/project/archive.html",
-                                context=context,
-                            )
-
-                current_app.send_task("Create archive", (start, end, language))
+                volume_size = form.cleaned_data.get("volume_size")
+                codec = form.cleaned_data.get("codec")
+
+                if archive_lock(language).locked():
+                    self.message_user(
+                        request,
+                        "Create archive task is already running for this language",
+                        level="ERROR",
+                    )
+                    return render(
+                        request,
+                        "admin/recordings/project/archive.html",
+                        context=context,
+                    )
+
+                current_app.send_task(
+                    "Create archive",
+                    (start, end, language),
+                    {
+                        "volume_size": volume_size and volume_size * 1000**3,
+                        "codec": codec,
+                    },
+                )
                 self.message_user(
                     request, f"Creating an archive of projects from {start} to {end}..."
                 )
@@ -204,14 +243,15 @@ class ProjectAdmin(ProjectPermissionMixin, admin.ModelAdmin):
     def get_urls(self, *args, **kwargs):
         urls = super().get_urls(*args, **kwargs)
         return [
-            path("download/<int:pk>/", self.download),
-            path("archive/", self.archive),
+            path("download/", self.admin_site.admin_view(self.download_many)),
+            path("download/<int:pk>/", self.admin_site.admin_view(self.download)),
+            path("archive/", self.admin_site.admin_view(self.archive)),
         ] + urls
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related("speaker", "script").only(
-            "session", "speaker__name", "script"
+            "session", "speaker__name", "script", "no_show", "private"
         )
 
     def project_zip(self, obj):
@@ -287,7 +327,7 @@ class SpeakerAdmin(OtherPermissionMixin, admin.ModelAdmin):
 
     def recorded(self, obj):
         if obj:
-            return obj.recorded
+            return obj.has_recordings
 
     recorded.boolean = True
 
@@ -334,7 +374,7 @@ class SpeakerAdmin(OtherPermissionMixin, admin.ModelAdmin):
                     obj.email,
                     obj.project.session.lower,
                     obj.project.no_show,
-                    obj.recorded,
+                    obj.has_recordings,
                 ]
             )
 
@@ -342,7 +382,14 @@ class SpeakerAdmin(OtherPermissionMixin, admin.ModelAdmin):
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
-        return qs.select_related("project").only("name", "sex", "email")
+        recordings = RecPrompt.objects.filter(
+            script__project__speaker=OuterRef("pk"), recording__gt=""
+        )
+        return (
+            qs.select_related("project")
+            .only("name", "sex", "email", "accent")
+            .annotate(has_recordings=Exists(recordings))
+        )
 
 
 class MixerNameAdmin(admin.ModelAdmin):
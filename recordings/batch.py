@@ -0,0 +1,192 @@
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.core.exceptions import ValidationError
+from django.core.files.base import File
+from django.utils.timezone import now
+from speech_recording import settings
+from .cache import invalidate
+from .models import *
+from .uploadhandlers import StoredUploadedFile, validate_name
+import hashlib
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+
+def spool(source):
+    """
+    A copy of the file object `source`, kept in memory up to
+    RECORDING_BATCH_SPOOL_SIZE bytes and on disk beyond
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=settings.RECORDING_BATCH_SPOOL_SIZE)
+    try:
+        shutil.copyfileobj(source, file)
+    except:
+        file.close()
+        raise
+    file.seek(0)
+    return File(file)
+
+
+def tar_files(fileobj):
+    """
+    (name, file) for each regular file of a tar stream, optionally compressed,
+    reading one file at a time as the stream arrives
+    """
+    with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+        for member in tar:
+            if member.isfile():
+                yield member.name, spool(tar.extractfile(member))
+
+
+def zip_files(fileobj):
+    """
+    (name, file) for each file of a zip archive, one at a time. The zip is
+    read from its end, so `fileobj` must hold the whole archive.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        for info in zf.infolist():
+            if not info.is_dir():
+                with zf.open(info) as member:
+                    yield info.filename, spool(member)
+
+
+def recprompt_lookup(prompts):
+    """
+    The recprompts by itemcode, and by mediaitem where no other recprompt
+    shares it
+    """
+    mediaitems = Counter(prompt.mediaitem for prompt in prompts)
+    lookup = {
+        prompt.mediaitem: prompt
+        for prompt in prompts
+        if mediaitems[prompt.mediaitem] == 1
+    }
+    lookup.update((f"{prompt.pk:010}", prompt) for prompt in prompts)
+    return lookup
+
+
+def store_recordings(script, files, workers=None):
+    """
+    Store each (name, file) of `files` as the recording of the script's
+    recprompt whose itemcode or mediaitem the file is named after, at most
+    `workers` at a time, then save the recordings with one bulk_update.
+    Returns a result for each file, so that those that failed can be sent
+    again. Each file is closed once it has been stored or refused.
+    """
+    workers = workers or settings.RECORDING_BATCH_WORKERS
+    field = RecPrompt._meta.get_field("recording")
+    storage = field.storage
+
+    prompts = list(script.recprompts.all())
+    for prompt in prompts:
+        # upload_path reads the project through the script
+        prompt.script = script
+    lookup = recprompt_lookup(prompts)
+
+    def store(prompt, name, file):
+        with file:
+            sha256 = hashlib.sha256()
+            for chunk in file.chunks():
+                sha256.update(chunk)
+
+            target = field.generate_filename(prompt, name)
+            # Don't overwrite the current file before the batch is saved
+            if target == prompt.recording.name:
+                target = storage.get_alternative_name(*os.path.splitext(target))
+
+            return StoredUploadedFile(
+                storage.save(target, file),
+                name,
+                "audio/wav",
+                file.size,
+                None,
+                sha256.hexdigest(),
+            )
+
+    results = []
+    claimed = set()
+    stored = []
+    pending = {}
+
+    def check(prompt, name, file):
+        if prompt is None:
+            return "No recording in the script has this itemcode or mediaitem"
+        if prompt.pk in claimed:
+            return "Another file is for the same recording"
+        try:
+            validate_name(field, name)
+        except ValidationError as e:
+            return " ".join(e.messages)
+
+        file.seek(0)
+        header = file.read(12)
+        file.seek(0)
+        if header[:4] != b"RIFF" or header[8:] != b"WAVE":
+            return "The file is not a WAV file"
+
+    def collect(futures):
+        for future in futures:
+            prompt, result = pending.pop(future)
+            try:
+                stored.append((prompt, future.result()))
+            except Exception as e:
+                result.update(status="error", error=str(e))
+            else:
+                result["status"] = "stored"
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, file in files:
+                name = os.path.basename(path)
+                result = {"name": path}
+                results.append(result)
+
+                prompt = lookup.get(os.path.splitext(name)[0])
+                error = check(prompt, name, file)
+                if error:
+                    result.update(status="error", error=error)
+                    file.close()
+                    continue
+
+                result["id"] = prompt.pk
+                claimed.add(prompt.pk)
+
+                # Wait for a file to be stored once the pool is saturated, to
+                # bound the files held in memory
+                if len(pending) >= workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                pending[pool.submit(store, prompt, name, file)] = (prompt, result)
+
+            collect(wait(pending).done)
+
+        replaced = []
+        for prompt, file in stored:
+            replaced.append(prompt.recording.name)
+            prompt.recording.name = file.stored_name
+            prompt.filesize = file.size
+            prompt.sha256 = file.sha256
+            prompt.updated_at = now()
+
+        # bulk_update bypasses auto_now and the save signals
+        RecPrompt.objects.bulk_update(
+            [prompt for prompt, file in stored],
+            ["recording", "filesize", "sha256", "updated_at"],
+        )
+    except:
+        # Wait for files still being stored, so that none are left behind
+        collect(wait(pending).done)
+        for prompt, file in stored:
+            storage.delete(file.stored_name)
+        raise
+
+    for name in replaced:
+        if name:
+            storage.delete(name)
+
+    invalidate(("script", script.pk))
+    return results
@@ -0,0 +1,123 @@
+from .models import *
+from .serializers import *
+from .renderers import *
+from .zipstream import stream_zip
+from .cache import cached
+from django.contrib.staticfiles import finders
+
+DTD_NAME = "SpeechRecPrompts_4.dtd"
+
+
+def projects():
+    """
+    Projects with everything their session files need, loaded in one query
+    plus one for the prefetched channels. ScriptSerializer reads each
+    script's recordings in a query of its own.
+    """
+    return Project.objects.select_related(
+        "speaker",
+        "script",
+        "RecordingConfiguration__Format",
+        "recordingMixerName",
+        "playbackMixerName",
+    ).prefetch_related("RecordingConfiguration__Format__channels")
+
+
+def render(renderer, serializer, instance):
+    return renderer().render(serializer(instance).data).encode(renderer.charset)
+
+
+def project_xml(project):
+    # The project name includes the speaker's
+    return cached(
+        f"project:{project.pk}",
+        [("project", project.pk), ("speaker", project.speaker_id)],
+        lambda: render(ProjectXMLRenderer, ProjectSerializer, project),
+    )
+
+
+def speaker_xml(speaker):
+    return cached(
+        f"speaker:{speaker.pk}",
+        [("speaker", speaker.pk)],
+        lambda: render(SpeakerXMLRenderer, SpeakerSerializer, speaker),
+    )
+
+
+def script_xml(script):
+    return cached(
+        f"script:{script.pk}",
+        [("script", script.pk)],
+        lambda: render(ScriptXMLRenderer, ScriptSerializer, script),
+    )
+
+
+def script_recordings(script, chunk_size=2000):
+    """
+    A script's recordings as ScriptSerializer renders them, read from the
+    database with a cursor
+    """
+    rows = script.recprompts.values_list(*RECORDING_COLUMNS)
+
+    for row in rows.iterator(chunk_size):
+        yield recording_data(*row, script.language)
+
+
+def stream_script_xml(script):
+    """
+    A script's XML, encoded a batch of recordings at a time
+    """
+    data = {"script": script_data(script.pk, script_recordings(script))}
+    renderer = ScriptXMLRenderer()
+
+    for chunk in renderer.stream(data):
+        yield chunk.encode(renderer.charset)
+
+
+def bundle(project, folder=""):
+    """
+    Render a project's session files one at a time, as (name, content) pairs
+    for a zip. The project should come from projects().
+    """
+    yield os.path.join(folder, f"{project.name}_project.prj"), project_xml(project)
+    yield (
+        os.path.join(folder, f"{project.speaker.pk}_speakers.xml"),
+        speaker_xml(project.speaker),
+    )
+    yield (
+        os.path.join(folder, f"{project.script.pk}_script.xml"),
+        script_xml(project.script),
+    )
+
+    # Found wherever the static files are, collected or not
+    with open(finders.find(DTD_NAME), "rb") as file:
+        yield os.path.join(folder, DTD_NAME), file.read()
+
+
+def bundle_zip(project):
+    """
+    A project's session files as a zip
+    """
+    return cached(
+        f"zip:{project.pk}",
+        [
+            ("project", project.pk),
+            ("speaker", project.speaker_id),
+            ("script", project.script_id),
+        ],
+        lambda: b"".join(stream_zip(bundle(project))),
+    )
+
+
+def bundles(pks, batch_size=50):
+    """
+    Session files of many projects, each in a folder of its own. Projects are
+    loaded a batch at a time, as iterator() would skip the prefetching.
+    """
+    pks = list(pks)
+
+    for i in range(0, len(pks), batch_size):
+        batch = projects().filter(pk__in=pks[i : i + batch_size], script__isnull=False)
+
+        for project in batch.order_by("session__startswith"):
+            yield from bundle(project, project.name)
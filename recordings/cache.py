@@ -0,0 +1,107 @@
+from django.db import transaction
+from redis.exceptions import RedisError
+from redis import Redis
+from speech_recording import settings
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "bundle"
+GLOBAL_VERSION = f"{PREFIX}:version"
+STATS = f"{PREFIX}:stats"
+
+_redis = None
+
+
+def connection():
+    global _redis
+
+    if _redis is None:
+        _redis = Redis.from_url(settings.BUNDLE_CACHE_URL)
+    return _redis
+
+
+def version_key(model, pk):
+    return f"{PREFIX}:version:{model}:{pk}"
+
+
+def cached(name, versions, render):
+    """
+    Return the rendered content for `name`, stored under the current version
+    of each (model, pk) it is built from and of the shared configuration.
+    On a miss `render` is called and its result stored with the time it took,
+    so a later hit can count the time saved.
+    """
+    try:
+        redis = connection()
+        keys = [GLOBAL_VERSION] + [version_key(model, pk) for model, pk in versions]
+        current = [int(version or 0) for version in redis.mget(keys)]
+        key = f"{PREFIX}:{name}:" + ".".join(str(version) for version in current)
+        content, render_time = redis.hmget(key, "content", "time")
+    except RedisError:
+        logger.exception("Bundle cache is unavailable")
+        return render()
+
+    if content is not None:
+        record(redis, hits=1, saved=float(render_time))
+        return content
+
+    started = time.perf_counter()
+    content = render()
+    render_time = time.perf_counter() - started
+
+    record(redis, key, content, render_time, misses=1, rendered=render_time)
+    return content
+
+
+def record(redis, key=None, content=None, render_time=None, **counts):
+    """
+    Add to the hit and miss counters, storing freshly rendered content
+    """
+    try:
+        with redis.pipeline() as pipe:
+            if key:
+                pipe.hset(key, mapping={"content": content, "time": render_time})
+                pipe.expire(key, settings.BUNDLE_CACHE_TIMEOUT)
+
+            for name, amount in counts.items():
+                pipe.hincrbyfloat(STATS, name, amount)
+            pipe.execute()
+    except RedisError:
+        logger.exception("Bundle cache is unavailable")
+
+
+def invalidate(*versions):
+    """
+    Bump the version of each (model, pk), or of the shared configuration if
+    none are given, once the current transaction commits. Bumping any sooner
+    would let a render of the old rows be stored under the new version.
+    """
+    keys = [version_key(model, pk) for model, pk in versions] or [GLOBAL_VERSION]
+
+    def bump():
+        try:
+            with connection().pipeline() as pipe:
+                for key in keys:
+                    pipe.incr(key)
+                pipe.execute()
+        except RedisError:
+            logger.exception("Bundle cache could not be invalidated")
+
+    transaction.on_commit(bump)
+
+
+def stats():
+    values = connection().hgetall(STATS)
+    stats = {
+        key: float(values.get(key.encode(), 0))
+        for key in ("hits", "misses", "saved", "rendered")
+    }
+    requests = stats["hits"] + stats["misses"]
+    stats["ratio"] = stats["hits"] / requests if requests else 0
+    return stats
+
+
+def reset_stats():
+    connection().delete(STATS)
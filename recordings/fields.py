@@ -1,11 +1,21 @@
 from django.db import models
+from .uploadhandlers import StoredUploadedFile
 
 
 class CustomFileField(models.FileField):
     """
-    Delete the file from storage if the model field is cleared
+    Delete the file from storage if the model field is cleared, and record
+    files that an upload handler has already stored without saving them again
     """
 
+    def pre_save(self, model_instance, add):
+        file = getattr(model_instance, self.attname)
+        if file and not file._committed and isinstance(file.file, StoredUploadedFile):
+            file.name = file.file.stored_name
+            file._committed = True
+            return file
+        return super().pre_save(model_instance, add)
+
     def save_form_data(self, instance, data):
         if data is not None:
             file = getattr(instance, self.attname)
@@ -37,6 +37,21 @@ class ArchiveForm(forms.Form):
     language = forms.ChoiceField(
         choices=Script.LANGUAGE_CHOICES, initial=("en", "English")
     )
+    volume_size = forms.IntegerField(
+        label="Volume size (GB)",
+        min_value=1,
+        required=False,
+        help_text="Split the archive into volumes no larger than this",
+    )
+    codec = forms.ChoiceField(
+        choices=(
+            ("stored", "Stored (no compression)"),
+            ("deflate", "Deflate"),
+            ("flac", "FLAC (lossless transcode)"),
+        ),
+        initial="stored",
+        help_text="FLAC needs the flac encoder installed on the Celery workers",
+    )
 
     def clean(self):
         cleaned_data = super().clean()
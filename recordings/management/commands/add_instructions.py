@@ -1,4 +1,6 @@
 from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+from recordings.cache import invalidate
 from recordings.models import Script, RecPrompt
 
 
@@ -25,8 +27,11 @@ class Command(BaseCommand):
             recprompts = list(script.recprompts.order_by("?")[:percentage])
             for index, recprompt in enumerate(recprompts):
                 recprompt.recinstructions = choices[index % len(choices)][0]
+                recprompt.updated_at = now()
 
-            RecPrompt.objects.bulk_update(recprompts, ["recinstructions"])
+            # bulk_update bypasses auto_now and the save signals
+            RecPrompt.objects.bulk_update(recprompts, ["recinstructions", "updated_at"])
+            invalidate(("script", script.pk))
 
         self.stdout.write(
             self.style.SUCCESS(
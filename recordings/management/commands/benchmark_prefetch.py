@@ -0,0 +1,105 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from storages.backends.s3 import S3Storage
+from types import SimpleNamespace
+from zipfile import ZipFile
+from reports.tasks import copy_to_zip, download, prefetch
+import boto3
+import os
+import tempfile
+import time
+
+BUCKET = "benchmark"
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare writing an archive from sequential downloads with the "
+        "prefetcher, against an in-process moto S3 stand-in."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recordings", type=int, default=200, help="Recordings to archive"
+        )
+        parser.add_argument(
+            "--size", type=int, default=512 * 1024, help="Bytes per recording"
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=20,
+            help="Milliseconds added to each download, as moto has no network",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            nargs="+",
+            default=[1, 2, 4, 8],
+            help="Prefetch workers to compare",
+        )
+        parser.add_argument(
+            "--budget",
+            type=int,
+            default=64 * 1024**2,
+            help="Prefetch memory budget in bytes",
+        )
+
+    def archive(self, recordings):
+        """
+        Seconds taken to write `recordings` into a zip
+        """
+        start = time.perf_counter()
+
+        with tempfile.TemporaryFile() as tmp, ZipFile(tmp, "w") as zf:
+            for obj, file in recordings:
+                copy_to_zip(zf, obj.name, file, obj.size)
+
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        # moto is only needed to benchmark, so it is not imported with the app
+        try:
+            from moto import mock_aws
+        except ImportError:
+            raise CommandError("The benchmark needs moto, pip install moto")
+
+        latency = options["latency"] / 1000
+
+        def fetch(file, spool):
+            time.sleep(latency)
+            return download(file, spool)
+
+        with mock_aws():
+            boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+            storage = S3Storage(bucket_name=BUCKET, region_name="us-east-1")
+
+            objects = []
+            for i in range(options["recordings"]):
+                name = f"recording{i}.wav"
+                storage.save(name, ContentFile(os.urandom(options["size"])))
+                objects.append(
+                    SimpleNamespace(
+                        name=name,
+                        size=options["size"],
+                        recording=SimpleNamespace(storage=storage, name=name),
+                    )
+                )
+
+            def sequential():
+                for obj in objects:
+                    with fetch(obj.recording, options["budget"]) as file:
+                        yield obj, file
+
+            baseline = self.archive(sequential())
+
+            self.stdout.write(f"{'Workers':>8} {'Time':>9} {'Speed-up':>9}")
+            self.stdout.write(f"{'none':>8} {baseline:>8.2f}s {1:>8.1f}x")
+
+            for workers in options["workers"]:
+                elapsed = self.archive(
+                    prefetch(objects, "recording", workers, options["budget"], fetch)
+                )
+                self.stdout.write(
+                    f"{workers:>8} {elapsed:>8.2f}s {baseline / elapsed:>8.1f}x"
+                )
@@ -0,0 +1,142 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.encoding import force_str
+from io import StringIO
+from xml.sax.saxutils import XMLGenerator
+from recordings.renderers import ScriptXMLRenderer
+import copy
+import gc
+import time
+
+
+class SAXScriptXMLRenderer(ScriptXMLRenderer):
+    """
+    The previous XMLGenerator based renderer, kept as the baseline
+    """
+
+    def _to_xml(self, xml, data, attrs={}):
+        if isinstance(data, (list, tuple)):
+            for item in data:
+                if isinstance(item, dict) and "attrs" in item.keys():
+                    attrs = item.pop("attrs", {})
+                xml.startElement(self.item_tag_name, attrs)
+                self._to_xml(xml, item)
+                xml.endElement(self.item_tag_name)
+
+        elif isinstance(data, dict):
+            for key, value in data.items():
+                if isinstance(value, dict) and "attrs" in value.keys():
+                    attrs = value.pop("attrs", {})
+                    value = value.get(key) or value
+                xml.startElement(key, attrs)
+                self._to_xml(xml, value)
+                xml.endElement(key)
+                attrs = {}
+
+        elif data is not None:
+            xml.characters(force_str(data))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        stream = StringIO()
+
+        xml = XMLGenerator(stream, self.charset)
+        xml.startDocument()
+        xml._write('<!DOCTYPE script SYSTEM "SpeechRecPrompts_4.dtd">')
+
+        self._to_xml(xml, data)
+
+        xml.endDocument()
+        return stream.getvalue()
+
+
+def script_data(prompts):
+    """
+    ScriptSerializer output for a script of `prompts` recordings, a quarter
+    of them with instructions
+    """
+    recordings = []
+
+    for i in range(prompts):
+        recprompt = {
+            "recprompt": {
+                "mediaitem": {
+                    "mediaitem": f'Prompt {i} with <markup> & "quotes"',
+                    "attrs": {"languageISO639code": "en"},
+                }
+            },
+            "attrs": {"finalsilence": "4000", "itemcode": f"{i:010}"},
+        }
+        if not i % 4:
+            recprompt = {"recinstructions": "Please whisper", **recprompt}
+        recordings.append(recprompt)
+
+    return {
+        "script": {
+            "recordingscript": {
+                "section": {
+                    "section": recordings,
+                    "attrs": {
+                        "name": "script_1",
+                        "promptphase": "recording",
+                        "speakerdisplay": "true",
+                    },
+                },
+            },
+            "attrs": {"id": "script_1"},
+        }
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the XML renderer with the previous XMLGenerator based one."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prompts",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help="Script sizes to render",
+        )
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Renders per size, best is kept"
+        )
+
+    def best(self, render, data, repeat):
+        times = []
+
+        for _ in range(repeat):
+            # The baseline pops attributes, so each run gets its own copy
+            copied = copy.deepcopy(data)
+            # Like timeit, keep garbage collection out of the timings
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                output = render(copied)
+                times.append(time.perf_counter() - start)
+            finally:
+                gc.enable()
+
+        return output, min(times)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'Prompts':>8} {'SAX':>10} {'Renderer':>10} {'Speed-up':>9}"
+        )
+
+        for prompts in options["prompts"]:
+            data = script_data(prompts)
+
+            old, old_time = self.best(
+                SAXScriptXMLRenderer().render, data, options["repeat"]
+            )
+            new, new_time = self.best(
+                ScriptXMLRenderer().render, data, options["repeat"]
+            )
+
+            if old != new:
+                raise CommandError(f"Output differs for {prompts} prompts")
+
+            self.stdout.write(
+                f"{prompts:>8} {old_time * 1000:>8.2f}ms {new_time * 1000:>8.2f}ms "
+                f"{old_time / new_time:>8.1f}x"
+            )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from recordings.cache import reset_stats, stats
+
+
+class Command(BaseCommand):
+    help = "Show the session bundle cache hit ratio and render time saved."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards"
+        )
+
+    def handle(self, *args, **options):
+        values = stats()
+
+        self.stdout.write(
+            f"Hits: {values['hits']:.0f}\n"
+            f"Misses: {values['misses']:.0f}\n"
+            f"Hit ratio: {values['ratio']:.1%}\n"
+            f"Render time: {values['rendered']:.3f}s\n"
+            f"Render time saved: {values['saved']:.3f}s"
+        )
+
+        if options["reset"]:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset."))
@@ -0,0 +1,278 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.timezone import now
+from psycopg2.extras import DateTimeTZRange
+from recordings.models import *
+import numpy as np
+import datetime
+import itertools
+import random
+import struct
+
+FIRST_NAMES = ("Alex", "Sam", "Jo", "Kim", "Lee", "Max", "Ali", "Eva", "Tom", "Mia")
+LAST_NAMES = ("Smith", "Jones", "Brown", "Patel", "Khan", "Silva", "Novak", "Kim")
+ACCENTS = ("", "", "Northern", "Southern", "Scottish", "Irish", "Welsh")
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven bright stars "
+    "shine above quiet hills and rivers carry cold water past old stone "
+    "bridges toward distant towns where people speak softly at night"
+).split()
+
+SESSION = datetime.timedelta(hours=1)
+
+
+def wave(rng, frames, sample_rate, channels, bits):
+    """
+    A little-endian PCM WAV file of a voice-like harmonic tone with noise,
+    as SpeechRecorder writes its recordings whatever the capture endianness
+    """
+    t = np.arange(frames) / sample_rate
+    pitch = rng.uniform(90, 250)
+    signal = sum(
+        np.sin(2 * np.pi * pitch * harmonic * t + rng.uniform(0, 2 * np.pi)) / harmonic
+        for harmonic in range(1, 5)
+    )
+    signal *= np.sin(np.pi * t / t[-1]) if frames > 1 else 1
+    signal = signal[:, None] + rng.normal(0, 0.02, (frames, channels))
+
+    # -12 dBFS peak
+    peak = 2 ** (bits - 1) - 1
+    samples = (signal / np.abs(signal).max() * 0.25 * peak).astype("<i4")
+
+    if bits == 8:
+        data = (samples + 128).astype(np.uint8).tobytes()
+    elif bits == 16:
+        data = samples.astype("<i2").tobytes()
+    elif bits == 24:
+        data = samples.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = samples.tobytes()
+
+    block_align = channels * bits // 8
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + len(data))
+        + b"WAVEfmt "
+        + struct.pack(
+            "<IHHIIHH",
+            16,
+            1,
+            channels,
+            sample_rate,
+            sample_rate * block_align,
+            block_align,
+            bits,
+        )
+        + b"data"
+        + struct.pack("<I", len(data))
+        + data
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic corpus of speakers, projects, scripts and "
+        "recordings for load testing and benchmarks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--projects", type=int, default=100, help="Speakers and projects"
+        )
+        parser.add_argument(
+            "--prompts", type=int, default=100, help="RecPrompts in each script"
+        )
+        parser.add_argument(
+            "--language", type=str, default="en", help="Language of the scripts"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed, for a repeatable corpus"
+        )
+        parser.add_argument(
+            "--start",
+            type=datetime.date.fromisoformat,
+            default=datetime.date(2030, 1, 1),
+            help="Date of the first session, if later than every existing one",
+        )
+        parser.add_argument(
+            "--min-duration",
+            type=float,
+            default=0.5,
+            help="Shortest recording in seconds",
+        )
+        parser.add_argument(
+            "--max-duration",
+            type=float,
+            default=2.0,
+            help="Longest recording in seconds",
+        )
+        parser.add_argument(
+            "--no-audio",
+            action="store_true",
+            help="Create the prompts without recordings",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=8, help="Concurrent recording uploads"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per bulk insert"
+        )
+
+    def handle(self, *args, **options):
+        config = (
+            RecordingConfig.objects.filter(default=True)
+            .select_related("Format")
+            .first()
+        )
+        defaults = {
+            "RecordingConfiguration": config,
+            "recordingMixerName_id": RecordingMixerName.get_default_pk(),
+            "playbackMixerName_id": PlaybackMixerName.get_default_pk(),
+            "microphone_id": Microphone.get_default_pk(),
+            "soundcard_id": Soundcard.get_default_pk(),
+        }
+
+        if not 0 < options["min_duration"] <= options["max_duration"]:
+            raise CommandError("Durations must be positive, shortest first.")
+
+        if not all(defaults.values()):
+            raise CommandError(
+                "Set a default recording configuration, recording and playback "
+                "mixer, microphone and soundcard first."
+            )
+
+        seed = options["seed"]
+        rng = random.Random(seed)
+
+        with transaction.atomic():
+            projects = self.create_projects(rng, defaults, options)
+            prompts = self.create_prompts(rng, projects, options)
+
+        self.stdout.write(
+            f"Created {len(projects)} projects with {len(prompts)} prompts."
+        )
+
+        if not options["no_audio"]:
+            size = self.create_recordings(prompts, config.Format, options)
+            self.stdout.write(f"Stored {len(prompts)} recordings, {size} bytes.")
+
+        self.stdout.write(self.style.SUCCESS("Successfully generated the corpus."))
+
+    def create_projects(self, rng, defaults, options):
+        """
+        Speakers, scripts and projects with back to back sessions, after the
+        start date and every existing session
+        """
+        count = options["projects"]
+        batch_size = options["batch_size"]
+
+        latest = Project.objects.aggregate(end=Max("session__endswith"))["end"]
+        start = timezone.make_aware(
+            datetime.datetime.combine(options["start"], datetime.time(9))
+        )
+        if latest and latest > start:
+            start = latest
+
+        speakers = Speaker.objects.bulk_create(
+            (
+                Speaker(
+                    name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    email=email,
+                    dateOfBirth=datetime.date(1950, 1, 1)
+                    + datetime.timedelta(days=rng.randrange(50 * 365)),
+                    sex=rng.choice(Speaker.SEX_CHOICES)[0],
+                    accent=rng.choice(ACCENTS),
+                )
+                for email in itertools.islice(self.emails(options["seed"]), count)
+            ),
+            batch_size,
+        )
+        scripts = Script.objects.bulk_create(
+            (Script(language=options["language"]) for _ in range(count)), batch_size
+        )
+
+        return Project.objects.bulk_create(
+            (
+                Project(
+                    speaker=speaker,
+                    script=script,
+                    session=DateTimeTZRange(
+                        start + i * SESSION, start + (i + 1) * SESSION
+                    ),
+                    **defaults,
+                )
+                for i, (speaker, script) in enumerate(zip(speakers, scripts))
+            ),
+            batch_size,
+        )
+
+    def emails(self, seed):
+        """
+        Speaker email addresses numbered from 0, skipping those taken by an
+        earlier run with the same seed
+        """
+        prefix = f"speaker{seed}."
+        taken = set(
+            Speaker.objects.filter(email__startswith=prefix).values_list(
+                "email", flat=True
+            )
+        )
+
+        for i in itertools.count():
+            email = f"{prefix}{i}@example.com"
+            if email not in taken:
+                yield email
+
+    def create_prompts(self, rng, projects, options):
+        instructions = [""] * 3 + list(RecPrompt.InstructionChoices.values)
+
+        def prompts():
+            for project in projects:
+                for i in range(options["prompts"]):
+                    words = rng.sample(WORDS, rng.randint(4, 10))
+                    yield RecPrompt(
+                        script=project.script,
+                        mediaitem=f"{' '.join(words).capitalize()}. "
+                        f"[{project.script.pk}.{i}]",
+                        recinstructions=rng.choice(instructions),
+                    )
+
+        return RecPrompt.objects.bulk_create(prompts(), options["batch_size"])
+
+    def create_recordings(self, prompts, format, options):
+        """
+        Generate a WAV file for every prompt in the configured format and
+        store it, then save the recordings' names and sizes in bulk
+        """
+        channels = format.channels.count() or 1
+        rate = format.sampleRate
+        field = RecPrompt._meta.get_field("recording")
+
+        def store(index, prompt):
+            # Seeded by the prompt's place in the run, so the audio doesn't
+            # depend on upload order or on the rows already in the database
+            rng = np.random.default_rng([options["seed"], index])
+            duration = rng.uniform(options["min_duration"], options["max_duration"])
+            data = wave(
+                rng, int(duration * rate), rate, channels, format.sampleSizeInBits
+            )
+
+            name = field.generate_filename(prompt, f"{prompt.pk:010}.wav")
+            prompt.recording.name = field.storage.save(name, ContentFile(data))
+            prompt.filesize = len(data)
+            prompt.updated_at = now()
+            return len(data)
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+            size = sum(pool.map(store, range(len(prompts)), prompts))
+
+        RecPrompt.objects.bulk_update(
+            prompts,
+            ["recording", "filesize", "updated_at"],
+            options["batch_size"],
+        )
+        return size
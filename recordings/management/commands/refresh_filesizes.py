@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from recordings.models import RecPrompt
+
+
+class Command(BaseCommand):
+    help = (
+        "Refresh the filesize of every RecPrompt from a listing of the bucket, "
+        "rather than a HEAD request per recording."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--prefix", type=str, default="", help="Only list keys under this prefix"
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the changes without saving them",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per bulk update"
+        )
+
+    def handle(self, *args, **options):
+        storage = RecPrompt._meta.get_field("recording").storage
+
+        if not hasattr(storage, "bucket"):
+            raise CommandError("Recordings are not stored in S3.")
+
+        prompts = {
+            storage._normalize_name(name): (pk, filesize)
+            for pk, name, filesize in RecPrompt.objects.filter(recording__gt="")
+            .values_list("pk", "recording", "filesize")
+            .iterator()
+        }
+
+        paginator = storage.bucket.meta.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(
+            Bucket=storage.bucket.name,
+            Prefix=storage._normalize_name(options["prefix"]),
+        )
+
+        changed = []
+        listed = 0
+
+        for page in pages:
+            for obj in page.get("Contents", ()):
+                pk, filesize = prompts.pop(obj["Key"], (None, None))
+
+                if pk is None:
+                    continue
+
+                listed += 1
+                if filesize != obj["Size"]:
+                    changed.append(RecPrompt(pk=pk, filesize=obj["Size"]))
+
+        if not options["dry_run"]:
+            # Nothing that is served depends on filesize, so updated_at stays
+            RecPrompt.objects.bulk_update(changed, ["filesize"], options["batch_size"])
+
+        self.stdout.write(
+            f"Listed {listed} recordings, {len(changed)} with a different size."
+        )
+
+        if prompts and not options["prefix"]:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(prompts)} recordings are missing from storage."
+                )
+            )
+
+        self.stdout.write(self.style.SUCCESS("Successfully refreshed the filesizes."))
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 20:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recordings', '0047_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recprompt',
+            name='sha256',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.23 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recordings', '0048_recprompt_sha256'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('upload_id', models.CharField(max_length=1024)),
+                ('length', models.PositiveBigIntegerField()),
+                ('offset', models.PositiveBigIntegerField(default=0)),
+                ('parts', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('recprompt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to='recordings.recprompt')),
+            ],
+        ),
+    ]
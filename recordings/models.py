@@ -14,6 +14,13 @@ import uuid
 import os
 
 
+def age_at(dob, date):
+    """
+    Age in whole years on `date` of someone born on `dob`
+    """
+    return date.year - dob.year - ((date.month, date.day) < (dob.month, dob.day))
+
+
 class Speaker(models.Model):
     SEX_CHOICES = (
         ("M", "MALE"),
@@ -29,6 +36,7 @@ class Speaker(models.Model):
     uuid = models.UUIDField(unique=True, default=uuid.uuid4, editable=False)
     code = models.CharField(max_length=64, default="", blank=True)
     accent = models.CharField(max_length=64, default="", blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     @property
     def age(self):
@@ -38,10 +46,7 @@ class Speaker(models.Model):
         dob = self.dateOfBirth
 
         if self.project and dob:
-            date = self.project.session.lower
-            return (
-                date.year - dob.year - ((date.month, date.day) < (dob.month, dob.day))
-            )
+            return age_at(dob, self.project.session.lower)
 
     @property
     def recorded(self):
@@ -62,6 +67,7 @@ class Format(models.Model):
     sampleRate = models.PositiveIntegerField(default=48000)
     bigEndian = models.BooleanField(default=True)
     sampleSizeInBits = models.PositiveSmallIntegerField(default=24)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.sampleRate} Hz / {self.sampleSizeInBits} bit / {self.channels.count()} ch"
@@ -75,6 +81,7 @@ class Channel(models.Model):
         default=0, help_text="Channel index starting from 0"
     )
     microphone = models.ForeignKey("recordings.Microphone", on_delete=models.PROTECT)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("Format", "index")
@@ -86,9 +93,7 @@ class Channel(models.Model):
 class GetDefaultMixin:
     @classmethod
     def get_default_pk(cls):
-        obj = cls.objects.filter(default=True).first()
-        if obj:
-            return obj.pk
+        return cls.objects.filter(default=True).values_list("pk", flat=True).first()
 
 
 class RecordingConfig(models.Model, GetDefaultMixin):
@@ -109,6 +114,7 @@ class RecordingConfig(models.Model, GetDefaultMixin):
     )
     progressToNextUnrecorded = models.BooleanField(default=True)
     default = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
@@ -127,6 +133,7 @@ class MixerName(models.Model, GetDefaultMixin):
     name = models.CharField(max_length=64)
     providerId = models.CharField(max_length=128)
     default = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         abstract = True
@@ -159,7 +166,8 @@ class FileModelQuerySet(models.QuerySet):
         for obj in self:
             for field in obj._meta.fields:
                 if field.__class__ == CustomFileField:
-                    getattr(obj, field.name).delete()
+                    # The rows are deleted below, so don't save each one first
+                    getattr(obj, field.name).delete(save=False)
 
         super(FileModelQuerySet, self).delete(*args, **kwargs)
 
@@ -253,6 +261,7 @@ class Project(models.Model):
     archive = models.ForeignKey(
         "reports.Archive", related_name="projects", on_delete=models.PROTECT, null=True
     )
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = FileModelQuerySet.as_manager()
 
@@ -294,6 +303,7 @@ class Project(models.Model):
 class Script(models.Model):
     LANGUAGE_CHOICES = trans_real.get_languages().items()
     language = models.CharField(max_length=7, choices=LANGUAGE_CHOICES, default="en")
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ("id",)
@@ -340,6 +350,8 @@ class RecPrompt(models.Model):
         blank=True,
     )
     filesize = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     objects = FileModelQuerySet.as_manager()
 
@@ -363,10 +375,31 @@ class RecPrompt(models.Model):
     def get_absolute_url(self):
         return f"/api/recordings/{self.pk}/"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded recording, so saving only measures a new one
+        if "recording" in instance.__dict__:
+            instance._recording_name = instance.__dict__["recording"]
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.recording:
-            self.filesize = self.recording.size
+        recording = self.recording
+        loaded = getattr(self, "_recording_name", recording.name)
+
+        if recording and not recording._committed:
+            # An upload's size and hash come from the upload, not storage
+            self.filesize = recording.size
+            self.sha256 = getattr(recording.file, "sha256", "")
+        elif recording.name != loaded:
+            # A file attached by name has to be measured in storage
+            self.filesize = recording.size if recording else None
+            self.sha256 = ""
+        elif recording and self.filesize is None:
+            self.filesize = recording.size
+
         super().save(*args, **kwargs)
+        self._recording_name = self.recording.name
 
     def delete(self, *args, **kwargs):
         if self.recording:
@@ -376,9 +409,43 @@ class RecPrompt(models.Model):
     def __str__(self):
         return self.mediaitem
 
-    def construct_filename(self):
+    def construct_filename(self, extension="wav"):
         speaker = self.script.project.speaker
-        return f"LMC_{self.script.get_iso_string()}_{speaker.pk}_{speaker.sex}_0_0_{self.pk}.wav"
+        return RecPrompt.filename(
+            self.script.language, speaker.pk, speaker.sex, self.pk, extension
+        )
+
+    @staticmethod
+    def filename(language, speaker_pk, sex, pk, extension="wav"):
+        """
+        Archive filename of a recording, from metadata loaded without the
+        related objects
+        """
+        iso_string = Script(language=language).get_iso_string()
+        return f"LMC_{iso_string}_{speaker_pk}_{sex}_0_0_{pk}.{extension}"
 
     class Meta:
         ordering = ("id",)
+
+
+class UploadSession(models.Model):
+    """
+    An upload of a recording in progress, stored as the parts of a multipart
+    upload to `name`. Resumable uploads are sent in chunks at increasing
+    offsets; presigned ones go straight to storage and only use `length`.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    recprompt = models.ForeignKey(
+        RecPrompt, related_name="upload_sessions", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=255)
+    upload_id = models.CharField(max_length=1024)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    parts = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def get_absolute_url(self):
+        return f"/api/recordings/{self.recprompt_id}/uploads/{self.pk}/"
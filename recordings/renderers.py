@@ -1,65 +1,126 @@
+from rest_framework.renderers import BaseRenderer
 from rest_framework_xml.renderers import XMLRenderer
-from xml.sax.saxutils import XMLGenerator, quoteattr
 from django.utils.encoding import force_str
-from io import StringIO
+from functools import lru_cache
+from itertools import islice
 
 
-class CustomXMLGenerator(XMLGenerator):
-    def startDocument(self, attrs):
-        self._write(f'<?xml version="1.0" encoding="{self._encoding}"')
+def text(value):
+    """
+    Escape character data the way XMLGenerator.characters does
+    """
+    if not isinstance(value, str):
+        value = force_str(value)
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    return value
 
-        for name, value in attrs.items():
-            self._write(f" {name}={quoteattr(value)}")
 
-        self._write("?>\n")
+def attribute(name, value):
+    """
+    ` name="value"`, quoted and escaped the way xml.sax.saxutils.quoteattr does
+    """
+    # Cache on the text, so that values such as 1 and True stay apart
+    return _attribute(name, text(value))
+
+
+@lru_cache(maxsize=4096)
+def _attribute(name, value):
+    if "\n" in value or "\r" in value or "\t" in value:
+        value = value.replace("\n", "&#10;").replace("\r", "&#13;")
+        value = value.replace("\t", "&#9;")
+    if '"' not in value:
+        return f' {name}="{value}"'
+    if "'" not in value:
+        return f" {name}='{value}'"
+    value = value.replace('"', "&quot;")
+    return f' {name}="{value}"'
+
+
+def attributes(attrs):
+    return "".join([attribute(name, value) for name, value in attrs.items()])
+
+
+def declaration(encoding, attrs={}):
+    return f'<?xml version="1.0" encoding="{encoding}"{attributes(attrs)}?>\n'
 
 
 class CustomXMLRenderer(XMLRenderer):
+    """
+    Writes escaped fragments straight into a list and joins them once, rather
+    than going through XMLGenerator, and leaves the data it renders untouched.
+    A dict's "attrs" entry becomes the attributes of the element it sits in;
+    list items keep the previous item's attributes unless they have their own.
+    """
+
     xml_attrs = {}
     root_tag = ("root", {})
 
-    def _to_xml(self, xml, data, attrs={}):
+    def _to_xml(self, write, data, skip_attrs=False):
         if isinstance(data, (list, tuple)):
+            tag = self.item_tag_name
+            start = f"<{tag}>"
+            end = f"</{tag}>"
+
             for item in data:
-                if isinstance(item, dict) and "attrs" in item.keys():
-                    attrs = item.pop("attrs", {})
-                xml.startElement(self.item_tag_name, attrs)
-                self._to_xml(xml, item)
-                xml.endElement(self.item_tag_name)
+                has_attrs = isinstance(item, dict) and "attrs" in item
+                if has_attrs:
+                    start = f"<{tag}{attributes(item['attrs'])}>"
+                write(start)
+                self._to_xml(write, item, has_attrs)
+                write(end)
 
         elif isinstance(data, dict):
             for key, value in data.items():
-                if isinstance(value, dict) and "attrs" in value.keys():
-                    attrs = value.pop("attrs", {})
-                    value = value.get(key) or value
-                xml.startElement(key, attrs)
-                self._to_xml(xml, value)
-                xml.endElement(key)
-                attrs = {}
+                if skip_attrs and key == "attrs":
+                    continue
+
+                if isinstance(value, str):
+                    # Most elements are text, so skip the recursion for them
+                    write(f"<{key}>{text(value)}</{key}>")
+                    continue
+
+                if isinstance(value, dict) and "attrs" in value:
+                    write(f"<{key}{attributes(value['attrs'])}>")
+                    inner = value.get(key) if key != "attrs" else None
+                    if not inner:
+                        self._to_xml(write, value, True)
+                    elif isinstance(inner, str):
+                        write(text(inner))
+                    else:
+                        self._to_xml(write, inner)
+                else:
+                    write(f"<{key}>")
+                    self._to_xml(write, value)
+
+                write(f"</{key}>")
 
         elif data is None:
             # Don't output any value
             pass
 
         else:
-            xml.characters(force_str(data))
+            write(text(data))
 
     def render(self, data, accepted_media_type=None, renderer_context=None):
         """
         Renders `data` into serialized XML.
         """
 
-        stream = StringIO()
-
-        xml = CustomXMLGenerator(stream, self.charset)
-        xml.startDocument(self.xml_attrs)
-        xml.startElement(*self.root_tag)
+        tag, attrs = self.root_tag
+        parts = [
+            declaration(self.charset, self.xml_attrs),
+            f"<{tag}{attributes(attrs)}>",
+        ]
 
-        self._to_xml(xml, data)
+        self._to_xml(parts.append, data)
 
-        xml.endElement(self.root_tag[0])
-        xml.endDocument()
-        return stream.getvalue()
+        parts.append(f"</{tag}>")
+        return "".join(parts)
 
 
 class ProjectXMLRenderer(CustomXMLRenderer):
@@ -80,19 +141,12 @@ class SpeakerXMLRenderer(CustomXMLRenderer):
         if data is None:
             return ""
 
-        stream = StringIO()
+        parts = [declaration(self.charset), "<speakers><speakers>"]
 
-        xml = XMLGenerator(stream, self.charset)
-        xml.startDocument()
-        xml.startElement("speakers", {})
-        xml.startElement("speakers", {})
+        self._to_xml(parts.append, data)
 
-        self._to_xml(xml, data)
-
-        xml.endElement("speakers")
-        xml.endElement("speakers")
-        xml.endDocument()
-        return stream.getvalue()
+        parts.append("</speakers></speakers>")
+        return "".join(parts)
 
 
 class ScriptXMLRenderer(CustomXMLRenderer):
@@ -107,13 +161,57 @@ class ScriptXMLRenderer(CustomXMLRenderer):
         if data is None:
             return ""
 
-        stream = StringIO()
+        parts = [
+            declaration(self.charset),
+            '<!DOCTYPE script SYSTEM "SpeechRecPrompts_4.dtd">',
+        ]
 
-        xml = XMLGenerator(stream, self.charset)
-        xml.startDocument()
-        xml._write('<!DOCTYPE script SYSTEM "SpeechRecPrompts_4.dtd">')
+        self._to_xml(parts.append, data)
 
-        self._to_xml(xml, data)
+        return "".join(parts)
 
-        xml.endDocument()
-        return stream.getvalue()
+    def stream(self, data, batch_size=100):
+        """
+        Render `data` as render() would, a batch of recordings at a time, so
+        its list of recordings can be any iterable and is never held whole
+        """
+        script = data["script"]
+        section = script["recordingscript"]["section"]
+
+        yield (
+            f"{declaration(self.charset)}"
+            '<!DOCTYPE script SYSTEM "SpeechRecPrompts_4.dtd">'
+            f"<script{attributes(script['attrs'])}><recordingscript>"
+            f"<section{attributes(section['attrs'])}>"
+        )
+
+        recordings = iter(section["section"])
+        empty = True
+
+        while True:
+            batch = list(islice(recordings, batch_size))
+            if not batch:
+                break
+
+            parts = []
+            self._to_xml(parts.append, batch)
+            yield "".join(parts)
+            empty = False
+
+        if empty:
+            # An empty list renders the section itself, as a nested element
+            yield "<section></section>"
+
+        yield "</section></recordingscript></script>"
+
+
+class PassthroughRenderer(BaseRenderer):
+    """
+    For views that build their own response body, such as streamed audio
+    """
+
+    media_type = "*/*"
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
@@ -0,0 +1,193 @@
+from botocore.exceptions import ClientError
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.http.request import UnreadablePostError
+from django.utils.timezone import now
+from rest_framework import serializers
+from speech_recording import settings
+from .models import *
+from .serializers import MAX_PARTS, check_not_archived
+from .storage import abort_upload, complete_upload, start_upload, upload_part
+from .uploadhandlers import StoredUploadedFile, validate_name
+import base64
+import binascii
+import os
+
+TUS_VERSION = "1.0.0"
+OFFSET_CONTENT_TYPE = "application/offset+octet-stream"
+
+
+class OffsetConflict(Exception):
+    """
+    A chunk was sent for an offset other than the session's
+    """
+
+
+def parse_metadata(header):
+    """
+    The Upload-Metadata header's comma separated keys and base64 values
+    """
+    metadata = {}
+
+    for pair in filter(None, (pair.strip() for pair in header.split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise serializers.ValidationError(f"Invalid Upload-Metadata {key}")
+
+    return metadata
+
+
+def start_session(prompt, filename, length):
+    """
+    Check that `prompt` can take a recording of `length` bytes named
+    `filename`, and start a resumable upload of it
+    """
+    field = RecPrompt._meta.get_field("recording")
+    part_size = settings.RECORDING_RESUMABLE_PART_SIZE
+
+    check_not_archived(prompt.script.project)
+    try:
+        validate_name(field, filename)
+    except ValidationError as e:
+        raise serializers.ValidationError(e.messages)
+
+    if not 0 < length <= part_size * MAX_PARTS:
+        raise serializers.ValidationError(
+            f"Upload-Length must be between 1 and {part_size * MAX_PARTS}"
+        )
+
+    name = field.generate_filename(prompt, os.path.basename(filename))
+    # Don't overwrite the current file before the upload is complete
+    if name == prompt.recording.name:
+        name = field.storage.get_alternative_name(*os.path.splitext(name))
+
+    return UploadSession.objects.create(
+        recprompt=prompt,
+        name=name,
+        upload_id=start_upload(field.storage, name),
+        length=length,
+    )
+
+
+def read(stream, size):
+    """
+    Up to `size` bytes of `stream`, fewer only if the client went away
+    """
+    data = bytearray()
+
+    try:
+        while len(data) < size:
+            chunk = stream.read(size - len(data))
+            if not chunk:
+                break
+            data += chunk
+    except (OSError, UnreadablePostError):
+        pass
+
+    return bytes(data)
+
+
+def receive(session, stream, size):
+    """
+    Store the `size` bytes of `stream` that follow the session's offset as
+    parts of RECORDING_RESUMABLE_PART_SIZE, saving the offset after each one
+    so that a broken connection only loses the part it was sending. Chunks
+    smaller than a part are refused unless they end the upload. Bytes short
+    of a whole part at the end of a larger chunk are not kept, and the client
+    sends them again from the offset it is given. The upload is completed
+    once every byte has been received, and an empty chunk at the end of an
+    upload whose completion failed tries it again.
+    """
+    storage = RecPrompt._meta.get_field("recording").storage
+    part_size = settings.RECORDING_RESUMABLE_PART_SIZE
+
+    if 0 < size < part_size and session.offset + size < session.length:
+        raise serializers.ValidationError(
+            f"Chunks must be at least {part_size} bytes, "
+            "except the one that ends the upload"
+        )
+
+    while size:
+        data = read(stream, min(part_size, size))
+        size -= len(data)
+        last = session.offset + len(data) == session.length
+
+        if not data or (len(data) < part_size and not last):
+            break
+
+        if session.offset == 0 and (data[:4] != b"RIFF" or data[8:12] != b"WAVE"):
+            discard(session)
+            raise serializers.ValidationError("The upload is not a WAV file")
+
+        part = upload_part(
+            storage, session.name, session.upload_id, len(session.parts) + 1, data
+        )
+
+        # Another request for the same offset may have stored this part first
+        updated = UploadSession.objects.filter(
+            pk=session.pk, offset=session.offset
+        ).update(
+            offset=F("offset") + len(data),
+            parts=session.parts + [part],
+            updated_at=now(),
+        )
+        if not updated:
+            raise OffsetConflict()
+
+        session.offset += len(data)
+        session.parts.append(part)
+
+    if session.offset == session.length:
+        finish(session)
+
+    return session.offset
+
+
+def finish(session):
+    """
+    Complete the session's upload and attach it to its recprompt. The session
+    is kept if storage fails to complete the upload, so that it can be tried
+    again.
+    """
+    field = RecPrompt._meta.get_field("recording")
+
+    try:
+        complete_upload(field.storage, session.name, session.upload_id, session.parts)
+    except ClientError as e:
+        raise serializers.ValidationError(f"The upload could not be completed: {e}")
+
+    try:
+        with transaction.atomic():
+            prompt = RecPrompt.objects.select_related("script__project").get(
+                pk=session.recprompt_id
+            )
+            check_not_archived(prompt.script.project)
+
+            field.save_form_data(
+                prompt,
+                StoredUploadedFile(
+                    session.name,
+                    os.path.basename(session.name),
+                    "audio/wav",
+                    session.length,
+                    None,
+                ),
+            )
+            prompt.save()
+            session.delete()
+    except serializers.ValidationError:
+        field.storage.delete(session.name)
+        session.delete()
+        raise
+
+
+def discard(session):
+    """
+    Abort the session's upload and forget it
+    """
+    field = RecPrompt._meta.get_field("recording")
+    abort_upload(field.storage, session.name, session.upload_id)
+    session.delete()
@@ -1,5 +1,12 @@
 from rest_framework import serializers
+from django.core import signing
+from speech_recording import settings
 from .models import *
+import os
+
+# S3's limit on the parts of a multipart upload
+MAX_PARTS = 10000
+UPLOAD_SALT = "recordings.upload"
 
 
 class FormatSerializer(serializers.ModelSerializer):
@@ -112,82 +119,148 @@ class SpeakerSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Speaker
-        exclude = ("email",)
-
+        exclude = ("email", "updated_at")
 
-class RecPromptSerializer(serializers.ModelSerializer):
-    recprompt = serializers.SerializerMethodField()
-    recinstructions = serializers.CharField(source="get_recinstructions_display")
 
+class RecordingSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecPrompt
-        exclude = ("script", "mediaitem")
+        fields = ("id", "mediaitem", "recording", "script")
 
-    def get_recprompt(self, instance):
-        return {
+    def validate_recording(self, value):
+        check_not_archived(self.instance.script.project)
+        return value
+
+
+def check_not_archived(project):
+    """
+    Check that the project that a recording belongs to is not already archived.
+    """
+    if project.archive:
+        raise serializers.ValidationError(
+            "This project has been archived and may not be amended"
+        )
+
+
+class RecordingUploadSerializer(serializers.Serializer):
+    """
+    A recording to be uploaded straight to storage, in parts of
+    RECORDING_UPLOAD_PART_SIZE
+    """
+
+    filename = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(
+        min_value=1, max_value=settings.RECORDING_UPLOAD_PART_SIZE * MAX_PARTS
+    )
+
+    def validate_filename(self, value):
+        if os.path.splitext(value)[1].lower() != ".wav":
+            raise serializers.ValidationError("Only .wav recordings may be uploaded")
+        return os.path.basename(value)
+
+    def validate(self, data):
+        check_not_archived(self.instance.script.project)
+        return data
+
+
+class UploadPartSerializer(serializers.Serializer):
+    part_number = serializers.IntegerField(min_value=1, max_value=MAX_PARTS)
+    etag = serializers.CharField()
+
+
+class RecordingUploadCompleteSerializer(serializers.Serializer):
+    """
+    The token a recording upload was started with, and the ETag of each of
+    its parts
+    """
+
+    token = serializers.CharField()
+    parts = UploadPartSerializer(many=True, allow_empty=False)
+
+    def validate_token(self, value):
+        try:
+            upload = signing.loads(
+                value, salt=UPLOAD_SALT, max_age=settings.RECORDING_UPLOAD_EXPIRY
+            )
+        except signing.BadSignature:
+            raise serializers.ValidationError("Invalid or expired upload token")
+
+        if upload["pk"] != self.instance.pk:
+            raise serializers.ValidationError("The token is for another recording")
+
+        session = self.instance.upload_sessions.filter(pk=upload["session"]).first()
+        if session is None:
+            raise serializers.ValidationError("The upload has expired")
+        return session
+
+    def validate(self, data):
+        check_not_archived(self.instance.script.project)
+        return data
+
+
+INSTRUCTIONS = dict(RecPrompt.InstructionChoices.choices)
+
+# The columns recording_data() is built from
+RECORDING_COLUMNS = ("pk", "mediaitem", "finalsilence", "recinstructions")
+
+
+def recording_data(pk, mediaitem, finalsilence, recinstructions, language):
+    """
+    A script's <recording> element, from the recprompt's own columns
+    """
+    recprompt = {
+        "recprompt": {
             "mediaitem": {
-                "mediaitem": instance.mediaitem,
-                "attrs": {"languageISO639code": instance.script.language},
+                "mediaitem": mediaitem,
+                "attrs": {"languageISO639code": language},
             }
+        },
+        "attrs": {
+            "finalsilence": str(finalsilence),
+            "itemcode": f"{pk:010}",
+        },
+    }
+    instructions = INSTRUCTIONS.get(recinstructions, recinstructions)
+    if instructions:
+        recprompt = {
+            **{"recinstructions": instructions},
+            **recprompt,
         }
+    return recprompt
 
 
-class RecordingSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = RecPrompt
-        fields = ("id", "mediaitem", "recording", "script")
-
-    def validate_recording(self, value):
-        """
-        Check that the project that this recording belongs to is not already archived.
-        """
-        if self.instance.script.project.archive:
-            raise serializers.ValidationError(
-                "This project has been archived and may not be amended"
-            )
-        return value
+def script_data(pk, recordings):
+    return {
+        "recordingscript": {
+            "section": {
+                "section": recordings,
+                "attrs": {
+                    "name": f"script_{pk}",
+                    "promptphase": "recording",
+                    "speakerdisplay": "true",
+                },
+            },
+        },
+        "attrs": {
+            "id": f"script_{pk}",
+        },
+    }
 
 
 class ScriptSerializer(serializers.ModelSerializer):
     script = serializers.SerializerMethodField()
 
     def get_recordings(self, instance):
-        data = RecPromptSerializer(instance.recprompts.all(), many=True).data
-        recordings = []
-
-        for recording in data:
-            recprompt = {
-                "recprompt": recording["recprompt"],
-                "attrs": {
-                    "finalsilence": str(recording["finalsilence"]),
-                    "itemcode": f"{recording['id']:010}",
-                },
-            }
-            if recording["recinstructions"]:
-                recprompt = {
-                    **{"recinstructions": recording["recinstructions"]},
-                    **recprompt,
-                }
-            recordings.append(recprompt)
-        return recordings
+        """
+        Built from value rows in a single query, rather than from RecPrompt
+        instances through a nested serializer
+        """
+        rows = instance.recprompts.values_list(*RECORDING_COLUMNS)
+        return [recording_data(*row, instance.language) for row in rows]
 
     def get_script(self, instance):
-        return {
-            "recordingscript": {
-                "section": {
-                    "section": self.get_recordings(instance),
-                    "attrs": {
-                        "name": f"script_{instance.id}",
-                        "promptphase": "recording",
-                        "speakerdisplay": "true",
-                    },
-                },
-            },
-            "attrs": {
-                "id": f"script_{instance.id}",
-            },
-        }
+        return script_data(instance.id, self.get_recordings(instance))
 
     class Meta:
         model = Script
-        exclude = ("id", "language")
+        exclude = ("id", "language", "updated_at")
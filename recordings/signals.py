@@ -1,8 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch.dispatcher import receiver
 from speech_recording import settings
 from calendly.client import Calendly
-from .models import Project
+from .models import *
+from .cache import invalidate
 
 
 @receiver(post_save, sender=Project)
@@ -30,3 +31,36 @@ def sync_to_calendly(sender, instance, **kwargs):
             if not invitees["collection"][0]["no_show"]:
                 payload = {"invitee": invitees["collection"][0]["uri"]}
                 no_show = client.request("post", "invitee_no_shows", data=payload)
+
+
+@receiver((post_save, post_delete), sender=Project)
+def invalidate_project(sender, instance, **kwargs):
+    invalidate(("project", instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Speaker)
+def invalidate_speaker(sender, instance, **kwargs):
+    invalidate(("speaker", instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Script)
+def invalidate_script(sender, instance, **kwargs):
+    invalidate(("script", instance.pk))
+
+
+@receiver((post_save, post_delete), sender=RecPrompt)
+def invalidate_recprompt(sender, instance, **kwargs):
+    if instance.script_id:
+        invalidate(("script", instance.script_id))
+
+
+@receiver((post_save, post_delete), sender=RecordingConfig)
+@receiver((post_save, post_delete), sender=Format)
+@receiver((post_save, post_delete), sender=Channel)
+@receiver((post_save, post_delete), sender=RecordingMixerName)
+@receiver((post_save, post_delete), sender=PlaybackMixerName)
+def invalidate_configuration(sender, instance, **kwargs):
+    """
+    Configuration is shared by many projects, so every bundle is invalidated
+    """
+    invalidate()
@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from collections import deque
+from storages.utils import clean_name
+import io
+
+
+def stored_object(file):
+    """
+    The S3 object of a stored file, from this thread's own boto3 resource.
+    S3Storage.bucket belongs to the thread that first used it, and resources
+    are not safe to share between threads.
+    """
+    storage = file.storage
+    key = storage._normalize_name(file.name)
+    return storage.connection.Object(storage.bucket_name, key)
+
+
+def open_stream(file):
+    """
+    Open a stored file for sequential reading without buffering the whole
+    object in memory (S3File downloads the entire object on first read)
+    """
+    if hasattr(file.storage, "bucket"):
+        return closing(stored_object(file).get()["Body"])
+
+    return file.open("rb")
+
+
+def open_range(file, start, end):
+    """
+    Open bytes `start` to `end` inclusive of a stored file for sequential
+    reading, with a handle of its own so ranges can be read in parallel
+    """
+    if hasattr(file.storage, "bucket"):
+        body = stored_object(file).get(Range=f"bytes={start}-{end}")["Body"]
+        return closing(body)
+
+    f = file.storage.open(file.name, "rb")
+    f.seek(start)
+    return BoundedReader(f, end - start + 1)
+
+
+class BoundedReader(io.RawIOBase):
+    """
+    Read-only file object over the next `size` bytes of an open file, which
+    it closes when it is closed
+    """
+
+    def __init__(self, file, size):
+        self.file = file
+        self.remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        buffer[: len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+class RangedReader(io.RawIOBase):
+    """
+    Read-only, seekable file object that fetches each read with a ranged GET,
+    so parts of a large stored file can be read without downloading all of it.
+    Wrap it in io.BufferedReader to coalesce small reads.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.size = file.size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise OSError("Negative seek position")
+
+        self.position = offset
+        return offset
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size)
+
+        if end <= self.position:
+            return 0
+
+        with open_range(self.file, self.position, end - 1) as f:
+            data = f.read()
+
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class MultipartWriter(io.RawIOBase):
+    """
+    Write-only, unseekable file object that streams its content into an S3
+    multipart upload. Parts are uploaded concurrently as they fill, with at
+    most `workers` parts held in memory at once. The upload is aborted if the
+    writer is closed by an exception, so no partial object is left behind.
+    """
+
+    def __init__(self, storage, name, part_size, workers):
+        self.name = clean_name(name)
+        self.part_size = part_size
+        self.workers = workers
+        self.position = 0
+        self.buffer = bytearray()
+        self.parts = deque()
+
+        key = storage._normalize_name(self.name)
+        params = storage._get_write_parameters(key, None)
+
+        self.object = storage.bucket.Object(key)
+        self.upload = self.object.initiate_multipart_upload(**params)
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+
+        return len(data)
+
+    def _upload_part(self, data):
+        # Wait for the oldest part once the pool is saturated to bound memory
+        if sum(not part.done() for part in self.parts) >= self.workers:
+            next(part for part in self.parts if not part.done()).result()
+
+        number = len(self.parts) + 1
+        part = self.upload.Part(number)
+        self.parts.append(self.pool.submit(self._send, part, number, data))
+
+    @staticmethod
+    def _send(part, number, data):
+        response = part.upload(Body=data)
+        return {"PartNumber": number, "ETag": response["ETag"]}
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            if self.buffer or not self.parts:
+                self._upload_part(bytes(self.buffer))
+                self.buffer.clear()
+
+            parts = [part.result() for part in self.parts]
+            self.upload.complete(MultipartUpload={"Parts": parts})
+        except:
+            self.abort()
+            raise
+        finally:
+            self.pool.shutdown()
+            super().close()
+
+    def abort(self):
+        for part in self.parts:
+            part.cancel()
+
+        self.pool.shutdown()
+        self.upload.abort()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
+def start_upload(storage, name):
+    """
+    Start a multipart upload to `name`, returning its id
+    """
+    key = storage._normalize_name(clean_name(name))
+    params = storage._get_write_parameters(key, None)
+    return storage.bucket.Object(key).initiate_multipart_upload(**params).id
+
+
+def presign_upload(storage, name, parts, expires):
+    """
+    Start a multipart upload to `name` and presign a PUT for each of its
+    `parts`, so a client can upload the parts straight to the bucket.
+    Returns the upload's id and the part URLs, in part order.
+    """
+    key = storage._normalize_name(clean_name(name))
+    client = storage.bucket.meta.client
+    upload_id = start_upload(storage, name)
+
+    urls = [
+        client.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": storage.bucket.name,
+                "Key": key,
+                "UploadId": upload_id,
+                "PartNumber": number,
+            },
+            ExpiresIn=expires,
+        )
+        for number in range(1, parts + 1)
+    ]
+    return upload_id, urls
+
+
+def upload_part(storage, name, upload_id, number, data):
+    """
+    Upload part `number` of a multipart upload, returning the part as
+    complete_upload() takes it
+    """
+    key = storage._normalize_name(clean_name(name))
+    part = storage.bucket.Object(key).MultipartUpload(upload_id).Part(number)
+    return {"PartNumber": number, "ETag": part.upload(Body=data)["ETag"]}
+
+
+def complete_upload(storage, name, upload_id, parts):
+    """
+    Complete a multipart upload from its parts' numbers and ETags. A failed
+    completion leaves the upload open, so that a client can upload a missing
+    part again and retry.
+    """
+    key = storage._normalize_name(clean_name(name))
+    storage.bucket.Object(key).MultipartUpload(upload_id).complete(
+        MultipartUpload={"Parts": parts}
+    )
+
+
+def abort_upload(storage, name, upload_id):
+    """
+    Abort a multipart upload, so that storage drops the parts it holds
+    """
+    key = storage._normalize_name(clean_name(name))
+    storage.bucket.Object(key).MultipartUpload(upload_id).abort()
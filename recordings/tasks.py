@@ -1,9 +1,12 @@
 from celery import shared_task
 from speech_recording import settings
 from calendly.client import Calendly
+from botocore.exceptions import ClientError
 from django.utils.timezone import now
-from recordings.models import Project
+from recordings.models import Project, RecPrompt, UploadSession
+from recordings.storage import abort_upload
 from psycopg2.extras import DateTimeTZRange
+import datetime
 
 
 @shared_task(name="Check missing bookings")
@@ -45,3 +48,28 @@ def check_missing_bookings():
             break
 
     return missing
+
+
+@shared_task(name="Clean up upload sessions")
+def clean_up_upload_sessions():
+    """
+    Abort resumable and presigned uploads that have had no chunk for
+    RECORDING_UPLOAD_SESSION_EXPIRY, so storage drops their parts
+    """
+    storage = RecPrompt._meta.get_field("recording").storage
+    expired = now() - datetime.timedelta(
+        seconds=settings.RECORDING_UPLOAD_SESSION_EXPIRY
+    )
+    sessions = UploadSession.objects.filter(updated_at__lt=expired)
+    count = 0
+
+    for session in sessions.iterator():
+        try:
+            abort_upload(storage, session.name, session.upload_id)
+        except ClientError:
+            # Already completed or aborted
+            pass
+        session.delete()
+        count += 1
+
+    return count
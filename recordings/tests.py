@@ -1,3 +1,816 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.urls import reverse
+from django.utils import timezone
+from django_otp import DEVICE_ID_SESSION_KEY
+from django_otp.plugins.otp_static.models import StaticDevice
+from moto import mock_aws
+from botocore.exceptions import ClientError
+from psycopg2.extras import DateTimeTZRange
+from zipfile import ZipFile
+from calendly.models import CalendlyForm
+from recordings import resumable
+from recordings.bundles import stream_script_xml
+from recordings.cache import version_key
+from recordings.models import *
+from recordings.renderers import ScriptXMLRenderer
+from recordings.serializers import ScriptSerializer
+from recordings.tasks import clean_up_upload_sessions
+from recordings.uploadhandlers import S3UploadHandler
+from reports.models import *
+from speech_recording import settings
+import boto3
+import datetime
+import hashlib
+import io
+import os
+import requests
+import statistics
+import struct
+import tarfile
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+# Projects in the larger dataset, and prompts in each of their scripts
+REGRESSION_SIZE = settings.env.int("REGRESSION_SIZE", default=10)
+# Timed requests per endpoint
+REGRESSION_REPEAT = settings.env.int("REGRESSION_REPEAT", default=5)
+# The table of query counts and latencies is only printed for a sized run
+REGRESSION_REPORT = "REGRESSION_SIZE" in os.environ
+
+
+def wave(frames=4800):
+    """
+    A short silent 16 bit mono WAV file
+    """
+    data = bytes(frames * 2)
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + len(data))
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, 1, 48000, 96000, 2, 16)
+        + b"data"
+        + struct.pack("<I", len(data))
+        + data
+    )
+
+
+class ScriptSerializerTest(TestCase):
+    def create_script(self, prompts):
+        script = Script.objects.create(language="en")
+        RecPrompt.objects.bulk_create(
+            RecPrompt(
+                script=script,
+                mediaitem=f"{script.pk} {i} <&>",
+                recinstructions=str(i % 8) if i % 2 else "",
+            )
+            for i in range(prompts)
+        )
+        return Script.objects.get(pk=script.pk)
+
+    def test_queries_do_not_grow_with_prompts(self):
+        for prompts in (1, 100):
+            script = self.create_script(prompts)
+
+            with self.assertNumQueries(1):
+                ScriptSerializer(script).data
+
+    def test_recordings(self):
+        script = self.create_script(2)
+        first, second = script.recprompts.all()
+        xml = ScriptXMLRenderer().render(ScriptSerializer(script).data)
+
+        self.assertIn(
+            f'<recording finalsilence="4000" itemcode="{first.pk:010}"><recprompt>'
+            f'<mediaitem languageISO639code="en">{script.pk} 0 &lt;&amp;&gt;</mediaitem>'
+            "</recprompt></recording>",
+            xml,
+        )
+        self.assertIn(
+            f'<recording finalsilence="4000" itemcode="{second.pk:010}">'
+            "<recinstructions>angry</recinstructions><recprompt>",
+            xml,
+        )
+
+    def test_streamed_xml_matches_rendered(self):
+        renderer = ScriptXMLRenderer()
+
+        # Over two of the renderer's batches, and none
+        for prompts in (250, 0):
+            with self.subTest(prompts=prompts):
+                script = self.create_script(prompts)
+                rendered = renderer.render(ScriptSerializer(script).data)
+
+                self.assertEqual(
+                    b"".join(stream_script_xml(script)),
+                    rendered.encode(renderer.charset),
+                )
+
+
+class BundleCacheTest(TestCase):
+    def test_saving_and_deleting_bump_the_version_on_commit(self):
+        redis = mock.MagicMock()
+        pipe = redis.pipeline.return_value.__enter__.return_value
+
+        with mock.patch("recordings.cache.connection", return_value=redis):
+            with self.captureOnCommitCallbacks(execute=True):
+                speaker = Speaker.objects.create(
+                    dateOfBirth=datetime.date(1990, 1, 1), name="Speaker"
+                )
+                # Not until the transaction commits
+                pipe.incr.assert_not_called()
+
+            pipe.incr.assert_called_once_with(version_key("speaker", speaker.pk))
+            pipe.incr.reset_mock()
+
+            pk = speaker.pk
+            with self.captureOnCommitCallbacks(execute=True):
+                speaker.delete()
+            pipe.incr.assert_called_once_with(version_key("speaker", pk))
+
+
+class ConditionalRetrieveTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "admin@test", "")
+        self.client.force_login(user)
+
+    def test_script_etag_follows_its_recprompts(self):
+        script, other = Script.objects.create(), Script.objects.create()
+        first, second, third = RecPrompt.objects.bulk_create(
+            RecPrompt(script=script, mediaitem=f"Prompt {i}") for i in range(3)
+        )
+        path = f"/api/scripts/{script.pk}/"
+
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # Neither leaves a later updated_at behind
+        etags = {etag}
+        for change in (
+            first.delete,
+            lambda: RecPrompt.objects.filter(pk=second.pk).update(script=other),
+        ):
+            change()
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            etag = response["ETag"]
+            self.assertNotIn(etag, etags)
+            etags.add(etag)
+
+
+class ProjectAdminTest(TestCase):
+    def test_downloads_need_login(self):
+        for path in (
+            "/admin/recordings/project/download/1/",
+            "/admin/recordings/project/download/?pk=1",
+            "/admin/recordings/project/archive/",
+        ):
+            with self.subTest(path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response["Location"].startswith(reverse("admin:login")))
+
+    def test_download_is_streamed_in_chunks(self):
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        session = timezone.now() + datetime.timedelta(days=1)
+        project = Project.objects.create(
+            speaker=Speaker.objects.create(
+                dateOfBirth=datetime.date(1990, 1, 1), name="Speaker"
+            ),
+            script=Script.objects.create(language="en"),
+            session=DateTimeTZRange(session, session + datetime.timedelta(hours=1)),
+        )
+        for i in range(20):
+            RecPrompt.objects.create(script=project.script, mediaitem=f"Prompt {i}")
+
+        user = get_user_model().objects.create_superuser("admin", "admin@test", "")
+        device = StaticDevice.objects.create(user=user, name="Static")
+        self.client.force_login(user)
+        client_session = self.client.session
+        client_session[DEVICE_ID_SESSION_KEY] = device.persistent_id
+        client_session.save()
+
+        with mock.patch("recordings.admin.DOWNLOAD_CHUNK_SIZE", 1024):
+            response = self.client.get(
+                f"/admin/recordings/project/download/{project.pk}/"
+            )
+            chunks = list(response.streaming_content)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 1024 for chunk in chunks))
+        with ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertIn(f"{project.script.pk}_script.xml", zf.namelist())
+
+
+class RecordingUploadTest(TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.s3 = boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME)
+        self.s3.create_bucket(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+
+        session = timezone.now() + datetime.timedelta(days=1)
+        self.project = Project.objects.create(
+            speaker=Speaker.objects.create(
+                dateOfBirth=datetime.date(1990, 1, 1), name="Speaker"
+            ),
+            script=Script.objects.create(language="en"),
+            session=DateTimeTZRange(session, session + datetime.timedelta(hours=1)),
+        )
+        self.prompt = RecPrompt.objects.create(
+            script=self.project.script, mediaitem="Prompt"
+        )
+        self.url = f"/api/recordings/{self.prompt.pk}/"
+
+        user = get_user_model().objects.create_superuser("admin", "admin@test", "")
+        self.client.force_login(user)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def open_uploads(self):
+        return self.s3.list_multipart_uploads(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        ).get("Uploads", [])
+
+    def presigned_upload(self, data):
+        """
+        Start a presigned upload of `data`, put its parts and complete it
+        """
+        response = self.client.post(
+            f"{self.url}upload/",
+            {"filename": "take.wav", "size": len(data)},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        upload = response.json()
+
+        parts = []
+        for part in upload["parts"]:
+            start = (part["part_number"] - 1) * upload["part_size"]
+            put = requests.put(
+                part["url"], data=data[start : start + upload["part_size"]]
+            )
+            parts.append(
+                {"part_number": part["part_number"], "etag": put.headers["ETag"]}
+            )
+
+        return self.client.post(
+            f"{self.url}upload/complete/",
+            {"token": upload["token"], "parts": parts},
+            content_type="application/json",
+        )
+
+    def test_streamed_upload(self):
+        data = wave()
+        response = self.client.patch(
+            self.url,
+            encode_multipart(BOUNDARY, {"recording": ContentFile(data, "take.wav")}),
+            content_type=MULTIPART_CONTENT,
+        )
+        self.assertEqual(response.status_code, 200)
+
+        self.prompt.refresh_from_db()
+        self.assertEqual(self.prompt.recording.read(), data)
+        self.assertEqual(self.prompt.filesize, len(data))
+        self.assertEqual(self.prompt.sha256, hashlib.sha256(data).hexdigest())
+
+    def test_refused_streamed_upload_is_deleted(self):
+        file_complete = S3UploadHandler.file_complete
+        stored = []
+
+        def record(handler, file_size):
+            stored.append(file_complete(handler, file_size))
+            return stored[-1]
+
+        with mock.patch.object(S3UploadHandler, "file_complete", record):
+            response = self.client.patch(
+                self.url,
+                encode_multipart(
+                    BOUNDARY,
+                    {"recording": ContentFile(wave(), "take.wav"), "script": "0"},
+                ),
+                content_type=MULTIPART_CONTENT,
+            )
+        self.assertEqual(response.status_code, 400)
+
+        # Stored as it arrived, then deleted once the request was refused
+        self.assertEqual(len(stored), 1)
+        objects = self.s3.list_objects_v2(Bucket=settings.AWS_STORAGE_BUCKET_NAME)
+        self.assertNotIn("Contents", objects)
+        self.prompt.refresh_from_db()
+        self.assertFalse(self.prompt.recording)
+
+    def test_presigned_upload(self):
+        data = wave()
+        response = self.presigned_upload(data)
+
+        self.assertEqual(response.status_code, 200)
+        self.prompt.refresh_from_db()
+        self.assertEqual(self.prompt.recording.read(), data)
+        self.assertEqual(self.prompt.filesize, len(data))
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_presigned_upload_of_other_data(self):
+        response = self.presigned_upload(b"Not a WAV file")
+
+        self.assertEqual(response.status_code, 400)
+        self.prompt.refresh_from_db()
+        self.assertFalse(self.prompt.recording)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(self.open_uploads())
+
+    def test_presigned_upload_of_archived_project(self):
+        self.project.archive = Archive.objects.create(
+            description=Description.objects.create(
+                name="Description", equipment="Microphone", location="Here"
+            )
+        )
+        self.project.save()
+
+        response = self.client.post(
+            f"{self.url}upload/",
+            {"filename": "take.wav", "size": 100},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.open_uploads())
+
+    def test_abandoned_presigned_upload_is_aborted(self):
+        response = self.client.post(
+            f"{self.url}upload/",
+            {"filename": "take.wav", "size": 100},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.open_uploads()), 1)
+
+        UploadSession.objects.update(
+            updated_at=timezone.now() - datetime.timedelta(days=2)
+        )
+        self.assertEqual(clean_up_upload_sessions(), 1)
+        self.assertFalse(self.open_uploads())
+
+    def start_session(self, length):
+        """
+        The Location of a new resumable upload of `length` bytes
+        """
+        response = self.client.post(
+            f"{self.url}uploads/",
+            HTTP_TUS_RESUMABLE="1.0.0",
+            HTTP_UPLOAD_LENGTH=str(length),
+            HTTP_UPLOAD_METADATA="filename dGFrZS53YXY=",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Upload-Offset"], "0")
+        self.assertEqual(
+            response["Upload-Min-Chunk-Size"],
+            str(settings.RECORDING_RESUMABLE_PART_SIZE),
+        )
+        return response["Location"]
+
+    def patch(self, location, data, offset):
+        return self.client.generic(
+            "PATCH",
+            location,
+            data,
+            content_type="application/offset+octet-stream",
+            HTTP_TUS_RESUMABLE="1.0.0",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resumable_upload(self):
+        part_size = settings.RECORDING_RESUMABLE_PART_SIZE
+        data = wave(part_size)
+        location = self.start_session(len(data))
+
+        response = self.patch(location, data[:part_size], 0)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], str(part_size))
+
+        response = self.client.head(location)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Upload-Offset"], str(part_size))
+        self.assertEqual(response["Upload-Length"], str(len(data)))
+
+        # A chunk for an offset the session has passed
+        response = self.patch(location, data[:part_size], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], str(part_size))
+
+        response = self.patch(location, data[part_size:], part_size)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], str(len(data)))
+
+        self.prompt.refresh_from_db()
+        self.assertEqual(self.prompt.recording.read(), data)
+        self.assertEqual(self.client.head(location).status_code, 404)
+        self.assertFalse(self.open_uploads())
+
+    def test_resumable_upload_completion_is_retried(self):
+        data = wave()
+        location = self.start_session(len(data))
+        complete_upload = resumable.complete_upload
+
+        def fail_once(*args):
+            if not calls:
+                calls.append(args)
+                raise ClientError({"Error": {"Code": "InternalError"}}, "Complete")
+            complete_upload(*args)
+
+        calls = []
+        with mock.patch("recordings.resumable.complete_upload", fail_once):
+            response = self.patch(location, data, 0)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                self.client.head(location)["Upload-Offset"], str(len(data))
+            )
+            self.assertFalse(self.prompt.recording)
+
+            # An empty chunk at the end completes the upload again. The
+            # test client leaves out the Content-Type of an empty body.
+            response = self.client.generic(
+                "PATCH",
+                location,
+                CONTENT_TYPE="application/offset+octet-stream",
+                CONTENT_LENGTH="0",
+                HTTP_TUS_RESUMABLE="1.0.0",
+                HTTP_UPLOAD_OFFSET=str(len(data)),
+            )
+            self.assertEqual(response.status_code, 204)
+
+        self.prompt.refresh_from_db()
+        self.assertEqual(self.prompt.recording.read(), data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(self.open_uploads())
+
+    def test_resumable_upload_refuses_small_chunks(self):
+        location = self.start_session(2 * settings.RECORDING_RESUMABLE_PART_SIZE)
+
+        response = self.patch(location, wave(), 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.head(location)["Upload-Offset"], "0")
+
+    def test_resumable_upload_delete(self):
+        location = self.start_session(len(wave()))
+
+        self.assertEqual(self.client.delete(location).status_code, 204)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(self.open_uploads())
+
+    def test_abandoned_resumable_upload_is_aborted(self):
+        self.start_session(len(wave()))
+        self.assertEqual(clean_up_upload_sessions(), 0)
+
+        UploadSession.objects.update(
+            updated_at=timezone.now() - datetime.timedelta(days=2)
+        )
+        self.assertEqual(clean_up_upload_sessions(), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(self.open_uploads())
+
+    def test_batch_upload_archives(self):
+        other = RecPrompt.objects.create(script=self.project.script, mediaitem="Other")
+        data = wave(48000)
+        files = {"Prompt.wav": data, "Other.wav": b"Not a recording"}
+
+        tar = io.BytesIO()
+        with tarfile.open(fileobj=tar, mode="w") as tf:
+            for name, content in files.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tf.addfile(info, io.BytesIO(content))
+
+        zip = io.BytesIO()
+        with ZipFile(zip, "w") as zf:
+            for name, content in files.items():
+                zf.writestr(name, content)
+
+        # Larger files than this are spooled to disk
+        with mock.patch.object(settings, "RECORDING_BATCH_SPOOL_SIZE", 1024):
+            for content_type, body in (
+                ("application/x-tar", tar),
+                ("application/zip", zip),
+            ):
+                response = self.client.post(
+                    f"/api/recordings/batch/?script={self.project.script.pk}",
+                    body.getvalue(),
+                    content_type=content_type,
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.json()["results"],
+                    [
+                        {
+                            "name": "Prompt.wav",
+                            "id": self.prompt.pk,
+                            "status": "stored",
+                        },
+                        {
+                            "name": "Other.wav",
+                            "status": "error",
+                            "error": "The file is not a WAV file",
+                        },
+                    ],
+                )
+
+                self.prompt.refresh_from_db()
+                self.assertEqual(self.prompt.recording.read(), data)
+                self.assertEqual(self.prompt.filesize, len(data))
+                other.refresh_from_db()
+                self.assertFalse(other.recording)
+
+
+class GenerateCorpusTest(TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME).create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def test_rerun_repeats_audio_with_new_speakers(self):
+        for _ in range(2):
+            call_command(
+                "generate_corpus",
+                projects=2,
+                prompts=2,
+                max_duration=0.5,
+                stdout=io.StringIO(),
+            )
+
+        emails = list(Speaker.objects.values_list("email", flat=True))
+        self.assertEqual(len(set(emails)), 4)
+
+        recordings = [
+            prompt.recording.read() for prompt in RecPrompt.objects.order_by("pk")
+        ]
+        self.assertEqual(recordings[:4], recordings[4:])
+        self.assertEqual(len(set(recordings)), 4)
+
+
+class EndpointRegressionTest(TestCase):
+    """
+    Request every API endpoint and admin page against a small dataset and
+    then a larger one, reporting query counts and p50/p95 latency, and fail
+    when an endpoint's query count grows with the dataset. Storage is mocked
+    with moto; set REGRESSION_SIZE and REGRESSION_REPEAT for a larger run,
+    which also prints the report.
+    """
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME).create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        CalendlyForm.objects.create(id=uuid.uuid4(), name="Form", private=False)
+
+        user = get_user_model().objects.create_superuser("admin", "admin@test", "")
+        device = StaticDevice.objects.create(user=user, name="Static")
+        self.client.force_login(user)
+        session = self.client.session
+        session[DEVICE_ID_SESSION_KEY] = device.persistent_id
+        session.save()
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def seed(self, size):
+        """
+        Bring the dataset up to `size` projects, each with a script of `size`
+        prompts whose recordings are only referenced, not stored
+        """
+        start = timezone.now() + datetime.timedelta(days=1)
+
+        for i in range(Project.objects.count(), size):
+            session = start + datetime.timedelta(days=i)
+            Project.objects.create(
+                speaker=Speaker.objects.create(
+                    dateOfBirth=datetime.date(1990, 1, 1), name=f"Speaker {i}"
+                ),
+                script=Script.objects.create(language="en"),
+                session=DateTimeTZRange(session, session + datetime.timedelta(hours=1)),
+            )
+
+        for script in Script.objects.all():
+            RecPrompt.objects.bulk_create(
+                RecPrompt(
+                    script=script,
+                    mediaitem=f"{script.pk} {i}",
+                    recording=f"recordings/{script.pk}_{i}.wav",
+                    filesize=1000,
+                )
+                for i in range(script.recprompts.count(), size)
+            )
+
+    def archive(self, prompt):
+        """
+        Store an archive holding `prompt`'s recording
+        """
+        buffer = io.BytesIO()
+        with ZipFile(buffer, "w") as zf:
+            zf.writestr(prompt.construct_filename(), wave())
+            info = zf.infolist()[0]
+
+        archive = Archive.objects.create(
+            description=Description.objects.create(
+                name="Description", equipment="Microphone", location="Here"
+            ),
+            file=ContentFile(buffer.getvalue(), "test.zip"),
+        )
+        ArchiveMember.objects.create(
+            archive=archive,
+            recprompt=prompt,
+            name=info.filename,
+            header_offset=info.header_offset,
+            compress_type=info.compress_type,
+            compress_size=info.compress_size,
+            file_size=info.file_size,
+            crc=info.CRC,
+        )
+
+    def endpoints(self):
+        """
+        (name, method, path, data) of each request, all for the first objects
+        created so that they are the same for every dataset size
+        """
+        project = Project.objects.order_by("pk").first()
+        prompt = project.script.recprompts.first()
+        upload = encode_multipart(
+            BOUNDARY, {"recording": ContentFile(wave(), "upload.wav")}
+        )
+        batch = encode_multipart(
+            BOUNDARY, {"recordings": ContentFile(wave(), f"{prompt.pk:010}.wav")}
+        )
+
+        endpoints = [
+            ("project", "GET", f"/api/projects/{project.pk}/", None),
+            ("next project", "GET", "/api/projects/next/", None),
+            ("speaker", "GET", f"/api/speakers/{project.speaker.pk}/", None),
+            ("script", "GET", f"/api/scripts/{project.script.pk}/", None),
+            ("recordings", "GET", "/api/recordings/", None),
+            (
+                "script recordings",
+                "GET",
+                f"/api/recordings/?script={project.script.pk}",
+                None,
+            ),
+            (
+                "recording search",
+                "GET",
+                f"/api/recordings/?search={prompt.mediaitem}",
+                None,
+            ),
+            ("recording", "GET", f"/api/recordings/{prompt.pk}/", None),
+            ("recording upload", "PATCH", f"/api/recordings/{prompt.pk}/", upload),
+            (
+                "batch upload",
+                "POST",
+                f"/api/recordings/batch/?script={project.script.pk}",
+                batch,
+            ),
+            ("archived", "GET", f"/api/recordings/{prompt.pk}/archived/", None),
+            ("admin", "GET", reverse("admin:index"), None),
+            (
+                "project download",
+                "GET",
+                f"/admin/recordings/project/download/{project.pk}/",
+                None,
+            ),
+            (
+                "projects download",
+                "GET",
+                f"/admin/recordings/project/download/?pk={project.pk}",
+                None,
+            ),
+            ("archive form", "GET", "/admin/recordings/project/archive/", None),
+        ]
+
+        for model in admin.site._registry:
+            opts = model._meta
+            name = f"{opts.app_label}.{opts.model_name}"
+            url = f"admin:{opts.app_label}_{opts.model_name}"
+            obj = model._default_manager.order_by("pk").first()
+
+            endpoints.append(
+                (f"{name} changelist", "GET", reverse(f"{url}_changelist"), None)
+            )
+            if obj:
+                path = reverse(f"{url}_change", args=(obj.pk,))
+                endpoints.append((f"{name} change", "GET", path, None))
+
+        return endpoints
+
+    def request(self, method, path, data):
+        if data is not None:
+            response = self.client.generic(
+                method, path, data, content_type=MULTIPART_CONTENT
+            )
+        else:
+            response = self.client.generic(method, path)
+
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+        self.assertEqual(response.status_code, 200, f"{method} {path}")
+        return response
+
+    def measure(self):
+        """
+        Query count of the first request to each endpoint, and the latencies
+        of REGRESSION_REPEAT more
+        """
+        results = {}
+
+        for name, method, path, data in self.endpoints():
+            # Each request resets connection.queries, so count them as they run
+            queries = []
+            with connection.execute_wrapper(
+                lambda execute, sql, *args: queries.append(sql) or execute(sql, *args)
+            ):
+                self.request(method, path, data)
+
+            times = []
+            for _ in range(REGRESSION_REPEAT):
+                start = time.perf_counter()
+                self.request(method, path, data)
+                times.append(time.perf_counter() - start)
+
+            results[name] = (len(queries), times)
+
+        return results
+
+    def report(self, small, large):
+        """
+        Print the query counts of each endpoint, and its latencies on the
+        larger dataset
+        """
+        print(f"\n{'Endpoint':<40} {'Queries':>11} {'p50':>9} {'p95':>9}")
+        for name, (queries, times) in large.items():
+            p95 = statistics.quantiles(times, n=20)[-1] if len(times) > 1 else times[0]
+            print(
+                f"{name:<40} {small[name][0]:>5} {queries:>5} "
+                f"{statistics.median(times) * 1000:>7.1f}ms {p95 * 1000:>7.1f}ms"
+            )
+
+    def test_queries_do_not_grow_with_dataset(self):
+        self.seed(2)
+        self.archive(RecPrompt.objects.order_by("pk").first())
+        small = self.measure()
+
+        self.seed(REGRESSION_SIZE)
+        large = self.measure()
+
+        if REGRESSION_REPORT:
+            self.report(small, large)
+
+        for name, (queries, times) in large.items():
+            with self.subTest(name):
+                self.assertLessEqual(queries, small[name][0])
@@ -0,0 +1,150 @@
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers
+from speech_recording import settings
+from .storage import MultipartWriter
+import hashlib
+import os
+
+
+def validate_name(field, file_name):
+    """
+    Run a file field's validators, such as its allowed extensions, on the name
+    of a file, so that a file that would be refused is never stored
+    """
+    for validator in field.validators:
+        validator(File(None, file_name))
+
+
+def is_valid_name(field, file_name):
+    try:
+        validate_name(field, file_name)
+    except ValidationError:
+        return False
+    return True
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    An uploaded file that its handler has already saved to storage as
+    `stored_name`, so saving it to a CustomFileField only records the name
+    """
+
+    def __init__(
+        self,
+        stored_name,
+        name,
+        content_type,
+        size,
+        charset,
+        sha256="",
+        content_type_extra=None,
+    ):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.stored_name = stored_name
+        self.sha256 = sha256
+
+
+class S3UploadHandler(FileUploadHandler):
+    """
+    Stream the upload for one of an instance's file fields straight into S3
+    as it arrives, counting and hashing it on the way, instead of spooling it
+    to a temporary file for storage to upload again. Files of more than one
+    RECORDING_UPLOAD_PART_SIZE part go up through a multipart upload as the
+    parts fill; smaller ones are stored with a single PUT.
+    """
+
+    def __init__(self, request, instance, field_name):
+        super().__init__(request)
+        self.instance = instance
+        self.field = instance._meta.get_field(field_name)
+        self.storage = self.field.storage
+        self.previous = getattr(instance, self.field.attname).name
+        self.name = None
+        self.file = None
+        self.writer = None
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.active = (
+            field_name == self.field.name
+            and self.name is None
+            and hasattr(self.storage, "bucket")
+            and is_valid_name(self.field, file_name)
+        )
+
+        if not self.active:
+            return
+
+        self.name = self.field.generate_filename(self.instance, file_name)
+        # Don't overwrite the current file before the upload is accepted
+        if self.name == self.previous:
+            self.name = self.storage.get_alternative_name(*os.path.splitext(self.name))
+
+        self.sha256 = hashlib.sha256()
+        self.buffer = bytearray()
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+
+        self.sha256.update(raw_data)
+
+        if self.writer is None:
+            self.buffer += raw_data
+            if len(self.buffer) < settings.RECORDING_UPLOAD_PART_SIZE:
+                return None
+
+            self.writer = MultipartWriter(
+                self.storage,
+                self.name,
+                settings.RECORDING_UPLOAD_PART_SIZE,
+                settings.RECORDING_UPLOAD_WORKERS,
+            )
+            raw_data, self.buffer = self.buffer, None
+
+        self.writer.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+
+        if self.writer:
+            self.writer.close()
+        else:
+            self.name = self.storage.save(self.name, ContentFile(bytes(self.buffer)))
+            self.buffer = None
+
+        self.file = StoredUploadedFile(
+            self.name,
+            self.file_name,
+            self.content_type,
+            file_size,
+            self.charset,
+            self.sha256.hexdigest(),
+            self.content_type_extra,
+        )
+        return self.file
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        """
+        Remove what was stored of an upload that was interrupted or refused
+        """
+        if self.file:
+            self.storage.delete(self.name)
+            self.file = None
+        elif self.writer and not self.writer.closed:
+            self.writer.abort()
+
+    def delete_replaced(self):
+        """
+        Delete the file that the stored upload replaced, once it is saved
+        """
+        if self.file and self.previous and self.previous != self.name:
+            self.storage.delete(self.previous)
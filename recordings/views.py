@@ -1,11 +1,20 @@
 from rest_framework import viewsets, mixins, generics
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError, UnsupportedMediaType
 from rest_framework import filters
 from django.views.decorators.csrf import csrf_exempt
-from django.http import Http404
+from django.core import signing
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils.timezone import now
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.db import transaction
+from django.db.models import Count, Max
+from botocore.exceptions import ClientError
 from dateutil.parser import parse
 from psycopg2.extras import DateTimeTZRange
 from urllib.parse import urlparse
@@ -16,12 +25,117 @@ from .models import *
 from .serializers import *
 from .permissions import TypeFormPermission, CalendlyPermission
 from .renderers import *
-
-
-class ProjectsViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
-    queryset = Project.objects.all()
+from .storage import complete_upload, open_range, presign_upload
+from .uploadhandlers import S3UploadHandler, StoredUploadedFile
+from .batch import store_recordings, tar_files, zip_files
+from . import resumable
+from . import bundles
+import hashlib
+import math
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+
+class CachedRetrieveMixin:
+    """
+    Retrieve the object's XML from the bundle cache instead of rendering it
+    on every request
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        renderer = self.renderer_classes[0]
+        return HttpResponse(
+            self.render_xml(self.get_object()),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+
+
+class StreamingRetrieveMixin:
+    """
+    Stream the object's XML as it is rendered, so large objects are never
+    held in memory whole
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        renderer = self.renderer_classes[0]
+        return StreamingHttpResponse(
+            self.stream_xml(self.get_object()),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+
+
+class ConditionalRetrieveMixin:
+    """
+    Answer conditional GETs with a strong ETag taken from the rows the object
+    is built from. get_state() returns those rows' pks, counts and updated_at
+    values from one query, so an unchanged object gets a 304 without being
+    loaded or serialized. There is no Last-Modified, as deleting or moving a
+    row changes the state without any updated_at moving forward.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            state = self.get_state()
+        except ValueError:
+            raise Http404
+
+        if not state:
+            raise Http404
+
+        # Serve the object the state was read from, which "next" could change
+        self.kwargs["pk"] = state["pk"]
+
+        values = sorted(state.items())
+        etag = quote_etag(hashlib.sha256(repr(values).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+
+        response["ETag"] = etag
+        return response
+
+
+class ProjectsViewSet(
+    ConditionalRetrieveMixin,
+    CachedRetrieveMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    queryset = bundles.projects()
     serializer_class = ProjectSerializer
     renderer_classes = (ProjectXMLRenderer,)
+    render_xml = staticmethod(bundles.project_xml)
+
+    def get_state(self):
+        projects = Project.objects.all()
+        pk = self.kwargs.get("pk")
+
+        if pk == "next":
+            projects = projects.filter(session__startswith__gte=now())
+        else:
+            projects = projects.filter(pk=pk)
+
+        format = "RecordingConfiguration__Format"
+
+        return (
+            projects.values(
+                "pk",
+                "updated_at",
+                "speaker__updated_at",
+                "RecordingConfiguration__updated_at",
+                f"{format}__updated_at",
+                "recordingMixerName__updated_at",
+                "playbackMixerName__updated_at",
+            )
+            .annotate(
+                channel_count=Count(f"{format}__channels"),
+                channels_updated_at=Max(f"{format}__channels__updated_at"),
+            )
+            .first()
+        )
 
     def get_object(self):
         queryset = self.filter_queryset(self.get_queryset())
@@ -42,16 +156,43 @@ class ProjectsViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
         raise Http404
 
 
-class SpeakersViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class SpeakersViewSet(
+    ConditionalRetrieveMixin,
+    CachedRetrieveMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
     queryset = Speaker.objects.all()
     serializer_class = SpeakerSerializer
     renderer_classes = (SpeakerXMLRenderer,)
+    render_xml = staticmethod(bundles.speaker_xml)
+
+    def get_state(self):
+        speakers = Speaker.objects.filter(pk=self.kwargs.get("pk"))
+        return speakers.values("pk", "updated_at").first()
 
 
-class ScriptsViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+class ScriptsViewSet(
+    ConditionalRetrieveMixin,
+    StreamingRetrieveMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
     queryset = Script.objects.all()
     serializer_class = ScriptSerializer
     renderer_classes = (ScriptXMLRenderer,)
+    stream_xml = staticmethod(bundles.stream_script_xml)
+
+    def get_state(self):
+        scripts = Script.objects.filter(pk=self.kwargs.get("pk"))
+        return (
+            scripts.values("pk", "updated_at")
+            .annotate(
+                recprompt_count=Count("recprompts"),
+                recprompts_updated_at=Max("recprompts__updated_at"),
+            )
+            .first()
+        )
 
 
 class CreateProjectView(generics.CreateAPIView):
@@ -182,7 +323,12 @@ class CalendlyWebhookView(generics.CreateAPIView):
         return Response({}, status=200)
 
 
+ZIP_TYPES = ("application/zip", "application/x-zip-compressed")
+TAR_TYPES = ("application/x-tar", "application/gzip", "application/x-gtar")
+
+
 class RecPromptView(
+    ConditionalRetrieveMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
     mixins.UpdateModelMixin,
@@ -202,3 +348,294 @@ class RecPromptView(
             except:
                 raise Http404
         return qs
+
+    def get_state(self):
+        recprompts = self.get_queryset().filter(pk=self.kwargs.get("pk"))
+        return recprompts.values("pk", "updated_at").first()
+
+    def update(self, request, *args, **kwargs):
+        """
+        Stream an uploaded recording straight into storage as it arrives,
+        unless the project is archived and the upload will be refused
+        """
+        prompt = self.get_object()
+
+        if prompt.script.project.archive:
+            return super().update(request, *args, **kwargs)
+
+        handler = S3UploadHandler(request, prompt, "recording")
+        request.upload_handlers.insert(0, handler)
+
+        try:
+            response = super().update(request, *args, **kwargs)
+        except:
+            handler.discard()
+            raise
+
+        handler.delete_replaced()
+        return response
+
+    @action(detail=True, renderer_classes=(PassthroughRenderer,))
+    def archived(self, request, *args, **kwargs):
+        """
+        Serve a recording from the archive it was added to, using ranged reads
+        of the archive rather than downloading it
+        """
+        prompt = self.get_object()
+
+        if not hasattr(prompt, "archived"):
+            raise Http404
+
+        member = prompt.archived
+        filename = os.path.basename(member.name)
+
+        content_type = "audio/flac" if filename.endswith(".flac") else "audio/wav"
+
+        response = StreamingHttpResponse(member.chunks(), content_type=content_type)
+        response["Content-Length"] = member.file_size
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+        return response
+
+    @action(
+        detail=True,
+        methods=["post"],
+        parser_classes=(JSONParser,),
+        renderer_classes=(JSONRenderer,),
+    )
+    def upload(self, request, *args, **kwargs):
+        """
+        Start an upload of the recording straight to storage, returning a
+        presigned URL for each part and a token to complete the upload with
+        """
+        prompt = self.get_object()
+        serializer = RecordingUploadSerializer(prompt, data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        field = RecPrompt._meta.get_field("recording")
+        name = field.generate_filename(prompt, serializer.validated_data["filename"])
+
+        # Never upload over a stored file, which the upload may not replace
+        if field.storage.exists(name):
+            name = field.storage.get_alternative_name(*os.path.splitext(name))
+
+        size = serializer.validated_data["size"]
+        part_size = settings.RECORDING_UPLOAD_PART_SIZE
+
+        upload_id, urls = presign_upload(
+            field.storage,
+            name,
+            math.ceil(size / part_size),
+            settings.RECORDING_UPLOAD_EXPIRY,
+        )
+        # Tracked so that clean_up_upload_sessions aborts it if never completed
+        session = UploadSession.objects.create(
+            recprompt=prompt, name=name, upload_id=upload_id, length=size
+        )
+        token = signing.dumps(
+            {"pk": prompt.pk, "session": str(session.pk)}, salt=UPLOAD_SALT
+        )
+
+        return Response(
+            {
+                "token": token,
+                "part_size": part_size,
+                "parts": [
+                    {"part_number": number, "url": url}
+                    for number, url in enumerate(urls, 1)
+                ],
+            }
+        )
+
+    @action(
+        detail=True,
+        methods=["post"],
+        url_path="upload/complete",
+        parser_classes=(JSONParser,),
+        renderer_classes=(JSONRenderer,),
+    )
+    def upload_complete(self, request, *args, **kwargs):
+        """
+        Complete an upload from the ETags of its parts, check that storage
+        holds a WAV file of the size it was started with, and attach it
+        """
+        prompt = self.get_object()
+        serializer = RecordingUploadCompleteSerializer(prompt, data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        session = serializer.validated_data["token"]
+        parts = [
+            {"PartNumber": part["part_number"], "ETag": part["etag"]}
+            for part in serializer.validated_data["parts"]
+        ]
+
+        field = RecPrompt._meta.get_field("recording")
+        file = field.attr_class(prompt, field, session.name)
+
+        try:
+            complete_upload(field.storage, file.name, session.upload_id, parts)
+        except ClientError as e:
+            # The upload stays open for another attempt until it expires
+            return Response({"parts": [str(e)]}, status=400)
+
+        session.delete()
+
+        with open_range(file, 0, 11) as f:
+            header = f.read()
+
+        if (
+            file.size != session.length
+            or header[:4] != b"RIFF"
+            or header[8:] != b"WAVE"
+        ):
+            field.storage.delete(file.name)
+            return Response(
+                {"recording": ["The upload is not a WAV file of the expected size"]},
+                status=400,
+            )
+
+        field.save_form_data(
+            prompt,
+            StoredUploadedFile(
+                file.name,
+                os.path.basename(file.name),
+                "audio/wav",
+                session.length,
+                None,
+            ),
+        )
+        prompt.save()
+
+        return Response(self.get_serializer(prompt).data)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        parser_classes=(MultiPartParser,),
+        renderer_classes=(JSONRenderer,),
+    )
+    def batch(self, request, *args, **kwargs):
+        """
+        Upload the recordings of the script given by ?script= at once, as a
+        tar or zip archive or as multipart files, each named after its
+        recprompt's itemcode or mediaitem. Returns a result for each file.
+        """
+        try:
+            script = Script.objects.select_related("project").get(
+                pk=request.query_params.get("script")
+            )
+            check_not_archived(script.project)
+        except (Script.DoesNotExist, Project.DoesNotExist, ValueError):
+            raise Http404
+
+        content_type = request.content_type.split(";")[0].strip()
+
+        try:
+            if content_type == "multipart/form-data":
+                results = store_recordings(
+                    script,
+                    (
+                        (file.name, file)
+                        for field, files in request.FILES.lists()
+                        for file in files
+                    ),
+                )
+            elif content_type in ZIP_TYPES:
+                # Zip archives are read from the end, so spool the body first
+                with tempfile.TemporaryFile() as f:
+                    shutil.copyfileobj(request.stream, f)
+                    results = store_recordings(script, zip_files(f))
+            elif content_type in TAR_TYPES:
+                results = store_recordings(script, tar_files(request.stream))
+            else:
+                raise UnsupportedMediaType(content_type)
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+            raise ParseError(f"Unreadable archive: {e}")
+
+        return Response({"results": results})
+
+    def tus_response(self, session, status=204, headers={}):
+        return Response(
+            status=status,
+            headers={
+                "Tus-Resumable": resumable.TUS_VERSION,
+                "Upload-Offset": session.offset,
+                "Upload-Length": session.length,
+                # Not part of tus, which has no way to ask for larger chunks
+                "Upload-Min-Chunk-Size": settings.RECORDING_RESUMABLE_PART_SIZE,
+                **headers,
+            },
+        )
+
+    @action(
+        detail=True,
+        methods=["post"],
+        parser_classes=(JSONParser,),
+        renderer_classes=(JSONRenderer,),
+    )
+    def uploads(self, request, *args, **kwargs):
+        """
+        Start a resumable upload of the recording, of Upload-Length bytes,
+        with its filename in Upload-Metadata. Chunks of at least
+        Upload-Min-Chunk-Size bytes, but for the last, are then sent to the
+        session's Location with PATCH, and its offset read with HEAD.
+        """
+        prompt = self.get_object()
+        metadata = resumable.parse_metadata(request.headers.get("Upload-Metadata", ""))
+
+        try:
+            length = int(request.headers["Upload-Length"])
+        except (KeyError, ValueError):
+            raise ParseError("Upload-Length is required")
+
+        session = resumable.start_session(
+            prompt, metadata.get("filename", f"{prompt.pk:010}.wav"), length
+        )
+        return self.tus_response(
+            session,
+            201,
+            {"Location": request.build_absolute_uri(session.get_absolute_url())},
+        )
+
+    @action(
+        detail=True,
+        methods=["head", "patch", "delete"],
+        url_path=r"uploads/(?P<session>[0-9a-f-]{36})",
+        parser_classes=(JSONParser,),
+        renderer_classes=(JSONRenderer,),
+    )
+    def upload_session(self, request, *args, **kwargs):
+        """
+        HEAD gives a resumable upload's offset, PATCH sends the chunk that
+        starts at it, and DELETE abandons the upload
+        """
+        prompt = self.get_object()
+        session = get_object_or_404(prompt.upload_sessions, pk=kwargs["session"])
+
+        if request.method == "HEAD":
+            return self.tus_response(session, 200, {"Cache-Control": "no-store"})
+
+        if request.method == "DELETE":
+            resumable.discard(session)
+            return self.tus_response(session)
+
+        if request.content_type != resumable.OFFSET_CONTENT_TYPE:
+            raise UnsupportedMediaType(request.content_type)
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            size = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            raise ParseError("Upload-Offset and Content-Length are required")
+
+        if offset + size > session.length:
+            raise ParseError("The chunk runs past Upload-Length")
+
+        try:
+            if offset != session.offset:
+                raise resumable.OffsetConflict()
+            resumable.receive(session, request.stream, size)
+        except resumable.OffsetConflict:
+            session = get_object_or_404(prompt.upload_sessions, pk=session.pk)
+            return self.tus_response(session, 409)
+
+        return self.tus_response(session)
@@ -0,0 +1,44 @@
+from zipfile import ZipFile
+import io
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable file object that collects what ZipFile writes to
+    it until the next chunk is taken, so a zip can be sent while it is built
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def write(self, data):
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_zip(members):
+    """
+    Yield a zip of (name, content) pairs chunk by chunk, taking each member
+    from the iterable only once the previous one has been sent
+    """
+    stream = ZipStream()
+
+    with ZipFile(stream, "w") as zf:
+        for name, content in members:
+            zf.writestr(name, content)
+            yield stream.take()
+
+    yield stream.take()
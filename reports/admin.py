@@ -1,5 +1,46 @@
 from django.contrib import admin
+from django.template.defaultfilters import filesizeformat
+from celery import current_app
 from .models import *
 
 admin.site.register(Description)
-admin.site.register(Archive)
+
+
+@admin.register(Archive)
+class ArchiveAdmin(admin.ModelAdmin):
+    list_display = ("__str__", "description", "verified", "verified_ok")
+    readonly_fields = (
+        "verified",
+        "_verify_duration",
+        "_verify_throughput",
+        "_verify_failures",
+    )
+    actions = ("verify",)
+
+    @admin.display(boolean=True, description="Verified OK")
+    def verified_ok(self, obj):
+        if obj.verified:
+            return not obj.verify_failures
+
+    @admin.display(description="Duration")
+    def _verify_duration(self, obj):
+        if obj.verify_duration is not None:
+            return f"{obj.verify_duration:.1f} seconds"
+        return ""
+
+    @admin.display(description="Throughput")
+    def _verify_throughput(self, obj):
+        if obj.verify_throughput:
+            return f"{filesizeformat(obj.verify_throughput)}/s"
+        return ""
+
+    @admin.display(description="Failures")
+    def _verify_failures(self, obj):
+        return "\n".join(obj.verify_failures)
+
+    @admin.action(description="Verify selected archives")
+    def verify(self, request, queryset):
+        for archive in queryset:
+            current_app.send_task("Verify archive", (archive.pk,))
+
+        self.message_user(request, f"Verifying {queryset.count()} archives...")
@@ -0,0 +1,38 @@
+from django.conf import settings
+from redis import Redis
+
+# Deletes the lock only while it still holds the token it was taken with
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def lock_name(language):
+    return f"archive:{language}"
+
+
+def archive_lock(language):
+    """
+    Lock on the broker held while an archive of a language is being built,
+    from the Create archive task until its shards have been assembled. It
+    expires after ARCHIVE_LOCK_TIMEOUT in case the release is lost.
+    """
+    redis = Redis.from_url(settings.CELERY_BROKER_URL)
+    return redis.lock(
+        lock_name(language),
+        timeout=settings.ARCHIVE_LOCK_TIMEOUT,
+        thread_local=False,
+    )
+
+
+def release_archive_lock(language, token):
+    """
+    Release the lock taken with `token`, unless it has expired or been taken
+    by another archive since
+    """
+    redis = Redis.from_url(settings.CELERY_BROKER_URL)
+    release = redis.register_script(RELEASE_SCRIPT)
+    release(keys=[lock_name(language)], args=[token])
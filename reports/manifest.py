@@ -0,0 +1,153 @@
+from django.conf import settings
+import pyarrow.parquet as pq
+import pyarrow as pa
+import tempfile
+import hashlib
+import shutil
+import struct
+import csv
+import io
+
+# Enough of the start of a WAV file to find its fmt and data chunks
+HEAD_SIZE = 64 * 1024
+
+SCHEMA = pa.schema(
+    [
+        ("file", pa.string()),
+        ("speaker", pa.int64()),
+        ("sex", pa.string()),
+        ("age", pa.int64()),
+        ("accent", pa.string()),
+        ("language", pa.string()),
+        ("mediaitem", pa.string()),
+        ("recinstructions", pa.string()),
+        ("filesize", pa.int64()),
+        ("duration", pa.float64()),
+        ("sample_rate", pa.int64()),
+        ("sha256", pa.string()),
+    ]
+)
+
+
+class HashingReader:
+    """
+    Wrap a file object to hash its content, and keep the start of it, as it
+    is read
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.head = bytearray()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.sha256.update(data)
+        self.size += len(data)
+
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[: HEAD_SIZE - len(self.head)]
+
+        return data
+
+
+def wave_format(head, size):
+    """
+    Sample rate and duration in seconds of a WAV file, from the start of it
+    and its total size
+    """
+    if head[:4] not in (b"RIFF", b"RIFX") or head[8:12] != b"WAVE":
+        return None, None
+
+    endian = "<" if head[:4] == b"RIFF" else ">"
+    offset = 12
+    sample_rate = byte_rate = None
+
+    while offset + 8 <= len(head):
+        chunk, length = struct.unpack(f"{endian}4sI", head[offset : offset + 8])
+        offset += 8
+
+        if chunk == b"fmt ":
+            sample_rate, byte_rate = struct.unpack(
+                f"{endian}II", head[offset + 4 : offset + 12]
+            )
+        elif chunk == b"data":
+            # Streaming writers may leave the data length unset
+            if not length or length > size - offset:
+                length = size - offset
+            if byte_rate:
+                return sample_rate, length / byte_rate
+            break
+
+        offset += length + length % 2
+
+    return sample_rate, None
+
+
+def manifest_row(filepath, project, prompt, reader, member=None):
+    """
+    The manifest row of a recording read through `reader`, and archived as
+    read through `member` if it was transcoded
+    """
+    speaker = project.speaker
+    member = member or reader
+    sample_rate, duration = wave_format(reader.head, reader.size)
+
+    return {
+        "file": filepath,
+        "speaker": speaker.pk,
+        "sex": speaker.sex,
+        "age": speaker.age,
+        "accent": speaker.accent,
+        "language": project.script.language,
+        "mediaitem": prompt.mediaitem,
+        "recinstructions": prompt.get_recinstructions_display(),
+        "filesize": member.size,
+        "duration": duration,
+        "sample_rate": sample_rate,
+        "sha256": member.sha256.hexdigest(),
+    }
+
+
+class ManifestWriter:
+    """
+    Collect manifest rows in temporary CSV and Parquet files, one Parquet row
+    group per batch, so that only a batch is held in memory at a time
+    """
+
+    def __init__(self):
+        temp = settings.FILE_UPLOAD_TEMP_DIR
+
+        self.csv = tempfile.TemporaryFile(dir=temp)
+        self.text = io.TextIOWrapper(self.csv, encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.text, fieldnames=SCHEMA.names)
+        self.writer.writeheader()
+
+        self.parquet = tempfile.TemporaryFile(dir=temp)
+        self.parquet_writer = pq.ParquetWriter(self.parquet, SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.parquet_writer.close()
+        self.parquet.close()
+        self.text.close()
+
+    def write(self, rows):
+        if rows:
+            self.writer.writerows(rows)
+            self.parquet_writer.write_table(pa.Table.from_pylist(rows, SCHEMA))
+
+    def save(self, zf):
+        self.text.flush()
+        self.parquet_writer.close()
+
+        for name, file in (
+            ("TABLE/MANIFEST.CSV", self.csv),
+            ("TABLE/MANIFEST.PARQUET", self.parquet),
+        ):
+            file.seek(0)
+            with zf.open(name, "w") as dest:
+                shutil.copyfileobj(file, dest)
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:47
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+import recordings.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recordings", "0046_recordingconfig_postrecdelay_and_more"),
+        ("reports", "0004_alter_archive_options"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Shard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(help_text="Name of the archive", max_length=255),
+                ),
+                (
+                    "file",
+                    recordings.fields.CustomFileField(
+                        upload_to="archived/shards",
+                        validators=[
+                            django.core.validators.FileExtensionValidator(["zip"])
+                        ],
+                    ),
+                ),
+                (
+                    "size",
+                    models.PositiveBigIntegerField(
+                        help_text="Recording bytes in the shard"
+                    ),
+                ),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "project",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="recordings.project",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("name", "project")},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.23 on 2026-10-18 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0005_shard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shard',
+            name='filesize',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+    ]
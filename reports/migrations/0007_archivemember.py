@@ -0,0 +1,29 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recordings', '0046_recordingconfig_postrecdelay_and_more'),
+        ('reports', '0006_shard_filesize'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveMember',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('header_offset', models.PositiveBigIntegerField()),
+                ('compress_type', models.PositiveSmallIntegerField()),
+                ('compress_size', models.PositiveBigIntegerField()),
+                ('file_size', models.PositiveBigIntegerField()),
+                ('crc', models.PositiveBigIntegerField()),
+                ('archive', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='members', to='reports.archive')),
+                ('recprompt', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archived', to='recordings.recprompt')),
+            ],
+        ),
+    ]
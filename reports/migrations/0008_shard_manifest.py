@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0007_archivemember'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shard',
+            name='manifest',
+            field=models.JSONField(default=list, editable=False),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0008_shard_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archive',
+            name='verified',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='archive',
+            name='verify_duration',
+            field=models.FloatField(blank=True, editable=False, help_text='Duration in seconds', null=True),
+        ),
+        migrations.AddField(
+            model_name='archive',
+            name='verify_failures',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='archive',
+            name='verify_throughput',
+            field=models.FloatField(blank=True, editable=False, help_text='Bytes per second', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-18 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0009_archive_verification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shard',
+            name='cpu_time',
+            field=models.FloatField(default=0, editable=False, help_text='CPU seconds spent building the shard'),
+        ),
+    ]
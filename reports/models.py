@@ -2,6 +2,10 @@ from django.db import models
 from django.core.validators import FileExtensionValidator
 from recordings.fields import CustomFileField
 from recordings.models import FileModelQuerySet
+from recordings.storage import open_range
+from zipfile import ZIP_DEFLATED, ZIP_STORED, sizeFileHeader
+import struct
+import zlib
 import os
 
 
@@ -19,6 +23,14 @@ class Archive(models.Model):
     file = CustomFileField(
         upload_to="archived", validators=[FileExtensionValidator(["zip"])], null=False
     )
+    verified = models.DateTimeField(null=True, blank=True, editable=False)
+    verify_duration = models.FloatField(
+        null=True, blank=True, editable=False, help_text="Duration in seconds"
+    )
+    verify_throughput = models.FloatField(
+        null=True, blank=True, editable=False, help_text="Bytes per second"
+    )
+    verify_failures = models.JSONField(default=list, blank=True, editable=False)
 
     objects = FileModelQuerySet.as_manager()
 
@@ -34,3 +46,99 @@ class Archive(models.Model):
         if self.file:
             self.file.delete()
         super(Archive, self).delete(*args, **kwargs)
+
+
+class Shard(models.Model):
+    """
+    A completed per-speaker part of an archive that is still being built
+    """
+
+    name = models.CharField(max_length=255, help_text="Name of the archive")
+    project = models.ForeignKey(
+        "recordings.Project", related_name="shards", on_delete=models.CASCADE
+    )
+    file = CustomFileField(
+        upload_to="archived/shards",
+        validators=[FileExtensionValidator(["zip"])],
+        null=False,
+    )
+    size = models.PositiveBigIntegerField(help_text="Recording bytes in the shard")
+    filesize = models.PositiveBigIntegerField(editable=False)
+    manifest = models.JSONField(default=list, editable=False)
+    cpu_time = models.FloatField(
+        default=0, editable=False, help_text="CPU seconds spent building the shard"
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = FileModelQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ("name", "project")
+
+    def __str__(self):
+        if self.file:
+            return os.path.basename(self.file.name)
+        return super().__str__()
+
+    def delete(self, *args, **kwargs):
+        if self.file:
+            self.file.delete()
+        super(Shard, self).delete(*args, **kwargs)
+
+
+class ArchiveMember(models.Model):
+    """
+    Location of a recording inside an archive, so it can be fetched with
+    ranged reads instead of downloading the whole zip
+    """
+
+    archive = models.ForeignKey(
+        Archive, related_name="members", on_delete=models.CASCADE
+    )
+    recprompt = models.OneToOneField(
+        "recordings.RecPrompt", related_name="archived", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=255)
+    header_offset = models.PositiveBigIntegerField()
+    compress_type = models.PositiveSmallIntegerField()
+    compress_size = models.PositiveBigIntegerField()
+    file_size = models.PositiveBigIntegerField()
+    crc = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return self.name
+
+    def chunks(self):
+        """
+        Yield the uncompressed member in chunks, using one ranged read for the
+        local file header and another for the data
+        """
+        start = self.header_offset
+
+        with open_range(self.archive.file, start, start + sizeFileHeader - 1) as f:
+            header = f.read(sizeFileHeader)
+
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        start += sizeFileHeader + name_length + extra_length
+
+        if self.compress_type == ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif self.compress_type == ZIP_STORED:
+            decompressor = None
+        else:
+            raise ValueError(f"Unsupported compression type {self.compress_type}")
+
+        end = start + self.compress_size - 1
+
+        remaining = self.compress_size
+
+        with open_range(self.archive.file, start, end) as f:
+            while remaining:
+                data = f.read(min(1024 * 1024, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield decompressor.decompress(data) if decompressor else data
+
+        if decompressor:
+            yield decompressor.flush()
@@ -1,84 +1,760 @@
 from django.core.files.storage import default_storage
+from django.template.defaultfilters import filesizeformat
+from django.conf import settings
 from psycopg2.extras import DateTimeTZRange
-from recordings.models import Project
-from celery import shared_task
-from zipfile import ZipFile
+from django.db import transaction
+from recordings.models import Project, RecPrompt, age_at
+from django.db.models import Max, Min
+from recordings.storage import open_stream, open_range, MultipartWriter, RangedReader
+from celery import shared_task, chord
+from django.utils.timezone import now
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+from zipfile import sizeFileHeader, stringFileHeader
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from collections import deque
+from reports.manifest import HashingReader, ManifestWriter, manifest_row
+from reports.locks import archive_lock, release_archive_lock
+from reports.zipwriter import RawZipWriter
 from reports.models import *
+import resource
 import tempfile
+import io
+import shutil
+import subprocess
+import struct
+import zlib
+import time
+import uuid
 import os
 
+CHUNK_SIZE = 1024 * 1024
+
+# Zip compression and recording extension of each codec. FLAC recordings are
+# already compressed, so they are stored.
+CODECS = {
+    "stored": (ZIP_STORED, "wav"),
+    "deflate": (ZIP_DEFLATED, "wav"),
+    "flac": (ZIP_STORED, "flac"),
+}
+
+# The FLAC codec needs the flac command line encoder on every worker
+FLAC_COMMAND = ["flac", "--silent", "--best", "--stdout", "-"]
+
 
 def write_line(file, text):
     file.write(f"{text}\n".encode("utf-8"))
 
 
+def copy_to_zip(zf, filepath, file, size=0):
+    """
+    Copy a file object into the archive in fixed-size chunks
+    """
+    zinfo = ZipInfo(filepath, date_time=time.localtime(time.time())[:6])
+    zinfo.compress_type = zf.compression
+    # A size hint lets zipfile decide up front whether ZIP64 headers are needed
+    zinfo.file_size = size or 0
+
+    with zf.open(zinfo, "w") as dest:
+        shutil.copyfileobj(file, dest, CHUNK_SIZE)
+
+    return zinfo.file_size
+
+
+def check_member(file, info, end):
+    """
+    Stream one member of a stored zip with a ranged read ending at `end` and
+    compare its CRC and size with the central directory, returning a failure
+    message if they differ
+    """
+    with open_range(file, info.header_offset, end - 1) as f:
+        header = f.read(sizeFileHeader)
+
+        if header[:4] != stringFileHeader:
+            return f"{info.filename}: bad local file header"
+
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        f.read(name_length + extra_length)
+
+        if info.compress_type == ZIP_DEFLATED:
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        elif info.compress_type == ZIP_STORED:
+            decompressor = None
+        else:
+            return f"{info.filename}: unsupported compression {info.compress_type}"
+
+        crc = size = 0
+        remaining = info.compress_size
+
+        while remaining:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                return f"{info.filename}: truncated"
+            remaining -= len(data)
+
+            if decompressor:
+                data = decompressor.decompress(data)
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+
+    if decompressor:
+        data = decompressor.flush()
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+
+        if not decompressor.eof:
+            return f"{info.filename}: truncated deflate stream"
+
+    if crc != info.CRC or size != info.file_size:
+        return f"{info.filename}: CRC or size mismatch"
+
+
+def download(file, spool):
+    """
+    Fetch a stored file into a temporary file, kept in memory up to `spool` bytes
+    """
+    tmp = tempfile.SpooledTemporaryFile(
+        max_size=spool, dir=settings.FILE_UPLOAD_TEMP_DIR
+    )
+    try:
+        with open_stream(file) as src:
+            shutil.copyfileobj(src, tmp, CHUNK_SIZE)
+    except:
+        tmp.close()
+        raise
+
+    tmp.seek(0)
+    return tmp
+
+
+def check_codec(codec):
+    """
+    Fail before any work is done if the codec's encoder is missing
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec}")
+
+    if codec == "flac" and not shutil.which(FLAC_COMMAND[0]):
+        raise RuntimeError(
+            "The flac encoder is not installed on this worker, "
+            "so recordings cannot be archived as FLAC"
+        )
+
+
+class Transcoded:
+    """
+    A recording transcoded into a temporary file of `size` bytes, with the
+    hashing reader its source was read through
+    """
+
+    def __init__(self, source, file, size):
+        self.source = source
+        self.file = file
+        self.size = size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def encode_flac(src):
+    """
+    Losslessly transcode a WAV file object with the flac encoder, which runs
+    in its own process so several recordings can be encoded at once
+    """
+    reader = HashingReader(src)
+    out = tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR)
+
+    try:
+        with subprocess.Popen(
+            FLAC_COMMAND, stdin=subprocess.PIPE, stdout=out
+        ) as process:
+            shutil.copyfileobj(reader, process.stdin, CHUNK_SIZE)
+            process.stdin.close()
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, FLAC_COMMAND)
+    except:
+        out.close()
+        raise
+
+    size = out.seek(0, os.SEEK_END)
+    out.seek(0)
+    return Transcoded(reader, out, size)
+
+
+def transcode(file, spool):
+    with open_stream(file) as src:
+        return encode_flac(src)
+
+
+def prefetch(objects, field, workers, budget, fetch=download):
+    """
+    Yield (object, file) pairs in the order given, downloading the file in
+    `field` of up to `workers` objects ahead of the one being written.
+    In-memory buffering is capped at `budget` bytes, larger files spill to disk.
+    """
+    queue = deque()
+    # `workers` files are queued while the caller holds one more
+    spool = budget // (workers + 1)
+
+    def drain(limit):
+        while len(queue) > limit:
+            obj, future = queue.popleft()
+            with future.result() as file:
+                yield obj, file
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for obj in objects:
+                yield from drain(workers)
+                file = getattr(obj, field)
+                queue.append((obj, pool.submit(fetch, file, spool)))
+
+            yield from drain(0)
+        finally:
+            for obj, future in queue:
+                if not future.cancel() and not future.exception():
+                    future.result().close()
+
+
+def peak_rss():
+    """
+    Peak resident set size of this worker process in bytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_time():
+    """
+    CPU seconds used by this worker process and its finished child processes
+    """
+    return sum(
+        usage.ru_utime + usage.ru_stime
+        for usage in (
+            resource.getrusage(resource.RUSAGE_SELF),
+            resource.getrusage(resource.RUSAGE_CHILDREN),
+        )
+    )
+
+
+def compression_summary(codec, size, filesize, cpu):
+    ratio = filesize / size if size else 0
+
+    return (
+        f"{codec}: {filesizeformat(size)} to {filesizeformat(filesize)}, "
+        f"ratio {ratio:.3f}, CPU {cpu:.1f}s"
+    )
+
+
+def summary(total, started):
+    elapsed = time.monotonic() - started
+    rate = filesizeformat(total / elapsed if elapsed else 0)
+
+    return (
+        f"{filesizeformat(total)} at {rate}/s, "
+        f"peak RSS {filesizeformat(peak_rss())}"
+    )
+
+
+@contextmanager
+def open_output(name, multipart):
+    """
+    Open a new file in storage for writing, either streamed into a multipart
+    upload or built in a temporary file and saved once complete
+    """
+    if multipart:
+        with MultipartWriter(
+            default_storage,
+            name,
+            settings.ARCHIVE_UPLOAD_PART_SIZE,
+            settings.ARCHIVE_UPLOAD_WORKERS,
+        ) as out:
+            yield out
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".zip") as tmp:
+            yield tmp
+            default_storage.save(name, tmp)
+
+
+@contextmanager
+def open_archive(name, multipart, compression=ZIP_STORED):
+    """
+    Open a new zip in storage
+    """
+    with open_output(name, multipart) as out:
+        with ZipFile(out, "w", compression, allowZip64=True) as zf:
+            yield zf
+
+
+def shard_name(archive_name, project):
+    name = os.path.splitext(os.path.basename(archive_name))[0]
+    return f"ARCHIVE/SHARDS/{name}/SPEAKER{project.speaker.pk}.zip"
+
+
+def volume_name(archive_name, number):
+    root, extension = os.path.splitext(archive_name)
+    return f"{root} part {number}{extension}"
+
+
+def plan_volumes(shards, volume_size):
+    """
+    Group shards into volumes of at most `volume_size` bytes without splitting
+    a shard, so each speaker stays within one volume. A shard larger than the
+    limit gets a volume of its own.
+    """
+    volumes = [[]]
+    size = 0
+
+    for shard in shards:
+        if volume_size and volumes[-1] and size + shard.filesize > volume_size:
+            volumes.append([])
+            size = 0
+
+        volumes[-1].append(shard)
+        size += shard.filesize
+
+    return volumes
+
+
+def wave_dir(speaker_pk):
+    return f"DATA/CHANNEL0/WAVE/SPEAKER{speaker_pk}"
+
+
+def index_members(archive, zf, projects, extension):
+    """
+    Record where each recording is stored in the archive
+    """
+    prompts = RecPrompt.objects.filter(
+        script__project__in=projects, recording__gt=""
+    ).values_list(
+        "pk",
+        "script__language",
+        "script__project__speaker",
+        "script__project__speaker__sex",
+    )
+    names = {
+        os.path.join(
+            wave_dir(speaker),
+            RecPrompt.filename(language, speaker, sex, pk, extension),
+        ): pk
+        for pk, language, speaker, sex in prompts.iterator()
+    }
+
+    ArchiveMember.objects.bulk_create(
+        [
+            ArchiveMember(
+                archive=archive,
+                recprompt_id=names[info.filename],
+                name=info.filename,
+                header_offset=info.header_offset,
+                compress_type=info.compress_type,
+                compress_size=info.compress_size,
+                file_size=info.file_size,
+                crc=info.CRC,
+            )
+            for info in zf.infolist()
+            if info.filename in names
+        ]
+    )
+
+
+def write_speakers(zf, projects):
+    """
+    Write the speaker table from tuples streamed with a server-side cursor
+    """
+    speakers = projects.values_list(
+        "speaker", "speaker__sex", "speaker__dateOfBirth", "speaker__accent", "session"
+    )
+
+    with zf.open("TABLE/SPEAKER.TXT", "w") as file:
+        write_line(file, "SCD\tSEX\tAGE\tACC")
+
+        for pk, sex, dob, accent, session in speakers.iterator():
+            age = age_at(dob, session.lower) if dob else None
+            write_line(file, f"{pk}\t{sex}\t{age}\t{accent}")
+
+
+def recordings(recprompts, stream, workers, budget, codec):
+    flac = codec == "flac"
+
+    if stream:
+        fetch = transcode if flac else download
+        yield from prefetch(recprompts, "recording", workers, budget, fetch)
+    else:
+        for prompt in recprompts:
+            src = io.BytesIO(prompt.recording.file.open().read())
+            yield prompt, encode_flac(src) if flac else src
+
+
+def write_project(zf, project, stream, workers, budget, codec):
+    """
+    Write a project's script and recordings into the zip, returning the
+    number of recording bytes archived and the project's manifest rows.
+    FLAC recordings are transcoded by up to `workers` encoders at once.
+    """
+    total = 0
+    manifest = []
+    speaker = wave_dir(project.speaker.pk)
+    script = f"DATA/CHANNEL0/SCRIPT/0_{project.speaker.pk}_0.TXT"
+    recprompts = project.script.recprompts.filter(recording__gt="").order_by("pk")
+
+    with zf.open(script, "w") as file:
+        for prompt in recprompts:
+            write_line(file, f"0_{project.speaker.pk}_{prompt.pk}")
+            write_line(file, f"\t{prompt.mediaitem}")
+            write_line(file, f"\t{prompt.get_recinstructions_display()}\n")
+
+    extension = CODECS[codec][1]
+
+    for prompt, src in recordings(recprompts, stream, workers, budget, codec):
+        filepath = os.path.join(speaker, prompt.construct_filename(extension))
+
+        if isinstance(src, Transcoded):
+            # The manifest describes the FLAC member, and the WAV it came from
+            reader = src.source
+            member = HashingReader(src)
+            copy_to_zip(zf, filepath, member, src.size)
+        else:
+            reader = member = HashingReader(src)
+            copy_to_zip(zf, filepath, reader, prompt.filesize)
+
+        total += reader.size
+        manifest.append(manifest_row(filepath, project, prompt, reader, member))
+
+    return total, manifest
+
+
+def write_description(zf, projects):
+    description = Description.objects.first()
+    sessions = projects.aggregate(
+        first=Min("session__startswith"), last=Max("session__endswith")
+    )
+
+    with zf.open(f"DOC/{description.name}.TXT", "w") as file:
+        write_line(file, f"{description.name}\n")
+        write_line(file, "Location:\n")
+        write_line(file, f"{description.location}\n")
+        write_line(file, "Equipment:\n")
+        write_line(file, f"{description.equipment}\n")
+        write_line(file, "Date range:\n")
+        write_line(
+            file,
+            f"{sessions['first']} to {sessions['last']}",
+        )
+
+
 @shared_task(name="Create archive")
-def create_archive(start, end, language):
-    projects = Project.objects.filter(
-        session__contained_by=DateTimeTZRange(start, end),
-        script__recprompts__recording__gt="",
-        script__language=language,
-        archive__isnull=True,
-    ).distinct()
+def create_archive(start, end, language, **options):
+    """
+    Split the archive into one shard per project, built in parallel, and
+    assemble them once every shard has completed. Shards completed by an
+    earlier attempt at the same archive are reused. Only one archive of a
+    language is built at a time.
+    """
+    check_codec(options.get("codec", "stored"))
+    lock = archive_lock(language)
+
+    token = uuid.uuid4().hex
+
+    if not lock.acquire(blocking=False, token=token):
+        return f"An archive of {language} projects is already being created"
+
+    try:
+        return queue_archive(start, end, language, token, **options)
+    except:
+        lock.release()
+        raise
+
+
+def queue_archive(start, end, language, token, **options):
+    """
+    Queue the shards and assembly of an archive, which release the lock taken
+    with `token` when they finish. It is released straight away if there is
+    nothing to archive.
+    """
+    projects = list(
+        Project.objects.filter(
+            session__contained_by=DateTimeTZRange(start, end),
+            script__recprompts__recording__gt="",
+            script__language=language,
+            archive__isnull=True,
+        )
+        .distinct()
+        .values_list("pk", "session")
+    )
 
     if projects:
-        first = projects.first().session.lower
-        last = projects.last().session.upper
+        first = projects[0][1].lower
+        last = projects[-1][1].upper
 
         archive_name = f"ARCHIVE/{first.year}/Resonance Speech Database [{language.upper()}] {first.date()} - {last.date()}.zip"
 
-        if not default_storage.exists(archive_name):
-            with tempfile.NamedTemporaryFile(suffix=".zip") as tmp:
-                with ZipFile(tmp, "w", allowZip64=True) as zf:
-                    with zf.open("TABLE/SPEAKER.TXT", "w") as file:
-                        write_line(file, "SCD\tSEX\tAGE\tACC")
-
-                        for project in projects:
-                            speaker = project.speaker
-                            write_line(
-                                file,
-                                f"{speaker.pk}\t{speaker.sex}\t{speaker.age}\t{speaker.accent}",
-                            )
-                    for project in projects:
-                        speaker = f"DATA/CHANNEL0/WAVE/SPEAKER{project.speaker.pk}"
-                        script = f"DATA/CHANNEL0/SCRIPT/0_{project.speaker.pk}_0.TXT"
-                        recprompts = project.script.recprompts.filter(recording__gt="")
-
-                        with zf.open(script, "w") as file:
-                            for prompt in recprompts:
-                                write_line(file, f"0_{project.speaker.pk}_{prompt.pk}")
-                                write_line(file, f"\t{prompt.mediaitem}")
-                                write_line(
-                                    file, f"\t{prompt.get_recinstructions_display()}\n"
-                                )
-
-                        for prompt in recprompts:
-                            filename = prompt.construct_filename()
-                            filepath = os.path.join(speaker, filename)
-                            zf.writestr(filepath, prompt.recording.file.open().read())
-                    description = Description.objects.first()
-
-                    with zf.open(f"DOC/{description.name}.TXT", "w") as file:
-                        write_line(file, f"{description.name}\n")
-                        write_line(file, "Location:\n")
-                        write_line(file, f"{description.location}\n")
-                        write_line(file, "Equipment:\n")
-                        write_line(file, f"{description.equipment}\n")
-                        write_line(file, "Date range:\n")
-                        write_line(
-                            file,
-                            f"{projects.first().session.lower} to {projects.last().session.upper}",
-                        )
-
-                default_storage.save(archive_name, tmp)
-
-                archive, created = Archive.objects.get_or_create(
-                    description=Description.objects.first(), file=archive_name
+        # Projects are only assigned once every volume is complete, so volumes
+        # without projects are from an attempt that is resumed here
+        exists = Archive.objects.filter(
+            file__in=(archive_name, volume_name(archive_name, 1)),
+            projects__isnull=False,
+        ).exists()
+
+        if not exists:
+            pks = [pk for pk, session in projects]
+            completed = set(
+                Shard.objects.filter(name=archive_name).values_list(
+                    "project", flat=True
                 )
-                updated = projects.update(archive=archive)
+            )
+            shards = [
+                create_shard.si(archive_name, pk, **options)
+                for pk in pks
+                if pk not in completed
+            ]
+            lock = (language, token)
+            assemble = assemble_archive.si(archive_name, pks, lock=lock, **options)
 
-                return f"{updated} projects archived to {archive_name}"
+            if shards:
+                chord(shards)(assemble.on_error(unlock_archive.si(*lock)))
+            else:
+                assemble.delay()
 
+            return (
+                f"Archiving {len(pks)} projects to {archive_name} "
+                f"({len(completed)} of {len(pks)} shards already complete)"
+            )
+
+        release_archive_lock(language, token)
         return "Archive with this name already exists"
 
+    release_archive_lock(language, token)
     return "No eligible projects found for archiving"
+
+
+@shared_task(name="Unlock archive")
+def unlock_archive(language, token):
+    release_archive_lock(language, token)
+
+
+@shared_task(
+    name="Create archive shard",
+    autoretry_for=(Exception,),
+    max_retries=3,
+    retry_backoff=True,
+)
+def create_shard(
+    archive_name,
+    project_pk,
+    stream=True,
+    multipart=True,
+    workers=None,
+    budget=None,
+    codec="stored",
+    **options,
+):
+    workers = workers or settings.ARCHIVE_PREFETCH_WORKERS
+    budget = budget or settings.ARCHIVE_PREFETCH_MEMORY
+
+    if Shard.objects.filter(name=archive_name, project=project_pk).exists():
+        return f"Shard of project {project_pk} is already complete"
+
+    check_codec(codec)
+
+    project = Project.objects.select_related("speaker", "script").get(pk=project_pk)
+    name = shard_name(archive_name, project)
+    started = time.monotonic()
+    cpu = cpu_time()
+
+    with open_archive(name, multipart, CODECS[codec][0]) as zf:
+        total, manifest = write_project(zf, project, stream, workers, budget, codec)
+
+    shard = Shard.objects.create(
+        name=archive_name,
+        project=project,
+        file=name,
+        size=total,
+        filesize=default_storage.size(name),
+        manifest=manifest,
+        cpu_time=cpu_time() - cpu,
+    )
+
+    return (
+        f"Project {project_pk} archived to {name} ({summary(total, started)}; "
+        f"{compression_summary(codec, total, shard.filesize, shard.cpu_time)})"
+    )
+
+
+@shared_task(name="Assemble archive")
+def assemble_archive(
+    archive_name,
+    project_pks,
+    multipart=True,
+    workers=None,
+    budget=None,
+    volume_size=None,
+    codec="stored",
+    lock=None,
+    **options,
+):
+    try:
+        return assemble_volumes(
+            archive_name, project_pks, multipart, workers, budget, volume_size, codec
+        )
+    finally:
+        if lock:
+            release_archive_lock(*lock)
+
+
+def assemble_volumes(
+    archive_name, project_pks, multipart, workers, budget, volume_size, codec
+):
+    workers = workers or settings.ARCHIVE_PREFETCH_WORKERS
+    budget = budget or settings.ARCHIVE_PREFETCH_MEMORY
+
+    projects = Project.objects.filter(pk__in=project_pks)
+    shards = Shard.objects.filter(name=archive_name, project__in=project_pks)
+    shards = shards.order_by("project__session__startswith")
+
+    if shards.count() != len(project_pks):
+        raise Exception(f"Not every shard of {archive_name} has completed")
+
+    volumes = plan_volumes(shards.defer("manifest"), volume_size)
+    started = time.monotonic()
+    cpu = cpu_time()
+    total = 0
+    updated = 0
+    archives = []
+
+    for number, volume in enumerate(volumes, 1):
+        name = archive_name if len(volumes) == 1 else volume_name(archive_name, number)
+        volume_projects = projects.filter(pk__in=[shard.project_id for shard in volume])
+
+        # Volumes completed by an earlier attempt are kept
+        archive = Archive.objects.filter(file=name).first()
+        if archive:
+            archives.append((archive, volume_projects))
+            continue
+
+        # Left in storage by an attempt that failed before recording it
+        if default_storage.exists(name):
+            default_storage.delete(name)
+
+        # Manifests are streamed in the same order, one at a time
+        manifests = shards.filter(pk__in=[shard.pk for shard in volume])
+        manifests = manifests.values_list("manifest", flat=True).iterator(1)
+
+        with open_output(name, multipart) as out, ManifestWriter() as manifest:
+            with RawZipWriter(out) as writer:
+                with writer.open_zip() as zf:
+                    write_speakers(zf, volume_projects)
+
+                for (shard, src), rows in zip(
+                    prefetch(volume, "file", workers, budget), manifests
+                ):
+                    writer.copy_raw(src)
+                    manifest.write(rows)
+                    total += shard.size
+
+                with writer.open_zip() as zf:
+                    manifest.save(zf)
+                    write_description(zf, volume_projects)
+
+        with transaction.atomic():
+            archive = Archive.objects.create(
+                description=Description.objects.first(), file=name
+            )
+            index_members(archive, writer, volume_projects, CODECS[codec][1])
+
+        archives.append((archive, volume_projects))
+
+    # Assigned once every volume is complete, so that the projects are still
+    # eligible, and the archive keeps its name, if an attempt fails part way
+    with transaction.atomic():
+        for archive, volume_projects in archives:
+            updated += volume_projects.update(archive=archive)
+
+    # Shard CPU time covers building each shard, add assembling them
+    size = filesize = 0
+    cpu = cpu_time() - cpu
+
+    for volume in volumes:
+        for shard in volume:
+            size += shard.size
+            filesize += shard.filesize
+            cpu += shard.cpu_time
+
+    shards.defer("manifest").delete()
+
+    return (
+        f"{updated} projects archived to {archive_name} in {len(volumes)} volumes "
+        f"({summary(total, started)}; "
+        f"{compression_summary(codec, size, filesize, cpu)})"
+    )
+
+
+@shared_task(name="Verify archive")
+def verify_archive(archive_pk, workers=None):
+    """
+    Read the central directory of an uploaded archive with ranged reads,
+    check its recordings against the database and verify the CRC of every
+    member in parallel
+    """
+    workers = workers or settings.ARCHIVE_VERIFY_WORKERS
+    archive = Archive.objects.get(pk=archive_pk)
+    started = time.monotonic()
+    failures = []
+
+    with io.BufferedReader(RangedReader(archive.file)) as raw:
+        with ZipFile(raw) as zf:
+            infos = sorted(zf.infolist(), key=lambda info: info.header_offset)
+            ends = [info.header_offset for info in infos[1:]] + [zf.start_dir]
+
+    waves = {
+        info.filename: info
+        for info in infos
+        if info.filename.startswith("DATA/CHANNEL0/WAVE/")
+    }
+    expected = RecPrompt.objects.filter(
+        script__project__archive=archive, recording__gt=""
+    ).count()
+
+    if len(waves) != expected:
+        failures.append(f"{len(waves)} recordings archived, {expected} expected")
+
+    for name, header_offset, crc in archive.members.values_list(
+        "name", "header_offset", "crc"
+    ):
+        info = waves.get(name)
+        if not info or (info.header_offset, info.CRC) != (header_offset, crc):
+            failures.append(f"{name}: does not match the member index")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(check_member, [archive.file] * len(infos), infos, ends)
+        failures += [failure for failure in results if failure]
+
+    elapsed = time.monotonic() - started
+    total = sum(info.compress_size for info in infos)
+
+    archive.verified = now()
+    archive.verify_duration = elapsed
+    archive.verify_throughput = total / elapsed if elapsed else None
+    archive.verify_failures = failures
+    archive.save(
+        update_fields=[
+            "verified",
+            "verify_duration",
+            "verify_throughput",
+            "verify_failures",
+        ]
+    )
+
+    return (
+        f"Verified {len(infos)} members of {archive} with {len(failures)} failures "
+        f"({summary(total, started)})"
+    )
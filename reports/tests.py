@@ -1,3 +1,542 @@
-from django.test import TestCase
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.utils import timezone
+from moto import mock_aws
+from psycopg2.extras import DateTimeTZRange
+from unittest import mock
+from zipfile import ZIP64_LIMIT, ZIP_DEFLATED, ZIP_STORED, ZipFile
+from recordings.zipstream import ZipStream
+from recordings.models import *
+from reports.models import *
+from reports.tasks import *
+from speech_recording import settings
+from reports.zipwriter import RawZipWriter
+import pyarrow.parquet as pq
+import boto3
+import csv
+import datetime
+import hashlib
+import io
+import os
+import struct
+import sys
+import tempfile
+import time
 
-# Create your tests here.
+
+class ArchiveMetadataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        Description.objects.create(name="Test", location="Here", equipment="Mic")
+
+    def create_projects(self, count, prompts=3):
+        """
+        Projects with recordings that are only referenced, not stored
+        """
+        start = timezone.now() + datetime.timedelta(days=Project.objects.count())
+        pks = []
+
+        for i in range(count):
+            speaker = Speaker.objects.create(
+                dateOfBirth=datetime.date(1990, 1, 1), name="Speaker", sex="F"
+            )
+            script = Script.objects.create(language="en")
+            session = start + datetime.timedelta(days=i)
+            project = Project.objects.create(
+                speaker=speaker,
+                script=script,
+                session=DateTimeTZRange(session, session + datetime.timedelta(hours=1)),
+            )
+            pks.append(project.pk)
+            RecPrompt.objects.bulk_create(
+                RecPrompt(
+                    script=script,
+                    mediaitem=f"{script.pk} {j}",
+                    recording=f"recordings/{script.pk}_{j}.wav",
+                )
+                for j in range(prompts)
+            )
+
+        return Project.objects.filter(pk__in=pks)
+
+    def count_queries(self, projects):
+        archive = Archive.objects.create(
+            description=Description.objects.first(), file="archived/test.zip"
+        )
+
+        with ZipFile(io.BytesIO(), "w") as zf:
+            for prompt in RecPrompt.objects.filter(script__project__in=projects):
+                speaker = prompt.script.project.speaker
+                zf.writestr(
+                    os.path.join(wave_dir(speaker.pk), prompt.construct_filename()),
+                    b"",
+                )
+
+            with CaptureQueriesContext(connection) as context:
+                write_speakers(zf, projects)
+                write_description(zf, projects)
+                index_members(archive, zf, projects, "wav")
+
+        self.assertEqual(archive.members.count(), projects.count() * 3)
+        return len(context)
+
+    def test_queries_do_not_grow_with_projects(self):
+        self.assertEqual(
+            self.count_queries(self.create_projects(1)),
+            self.count_queries(self.create_projects(10)),
+        )
+
+    def test_speaker_table(self):
+        projects = self.create_projects(2)
+
+        with ZipFile(io.BytesIO(), "w") as zf:
+            write_speakers(zf, projects)
+            table = zf.read("TABLE/SPEAKER.TXT").decode().splitlines()
+
+        self.assertEqual(table[0], "SCD\tSEX\tAGE\tACC")
+        self.assertEqual(
+            table[1:],
+            [
+                f"{project.speaker.pk}\tF\t{project.speaker.age}\t"
+                for project in projects
+            ],
+        )
+
+
+def wave(frames=4800):
+    """
+    A short 16 bit mono WAV file of noise
+    """
+    data = os.urandom(frames * 2)
+    return (
+        b"RIFF"
+        + struct.pack("<I", 36 + len(data))
+        + b"WAVEfmt "
+        + struct.pack("<IHHIIHH", 16, 1, 1, 48000, 96000, 2, 16)
+        + b"data"
+        + struct.pack("<I", len(data))
+        + data
+    )
+
+
+class ArchiveTaskTest(TestCase):
+    """
+    Build archives from stored recordings, with storage mocked by moto
+    """
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME).create_bucket(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME
+        )
+
+        format = Format.objects.create()
+        microphone = Microphone.objects.create(model="Microphone", default=True)
+        Soundcard.objects.create(model="Soundcard", default=True)
+        Channel.objects.create(Format=format, microphone=microphone)
+        RecordingConfig.objects.create(Format=format, default=True)
+        RecordingMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        PlaybackMixerName.objects.create(name="Mixer", providerId="0", default=True)
+        Description.objects.create(name="Test", location="Here", equipment="Mic")
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def create_projects(self, count, prompts=2, frames=4800):
+        # Before any earlier projects, so that each call archives on its own
+        start = timezone.now() - datetime.timedelta(
+            days=count + Project.objects.count()
+        )
+        projects = []
+
+        for i in range(count):
+            session = start + datetime.timedelta(days=i)
+            project = Project.objects.create(
+                speaker=Speaker.objects.create(
+                    dateOfBirth=datetime.date(1990, 1, 1), name="Speaker", sex="F"
+                ),
+                script=Script.objects.create(language="en"),
+                session=DateTimeTZRange(session, session + datetime.timedelta(hours=1)),
+            )
+            for j in range(prompts):
+                prompt = RecPrompt.objects.create(
+                    script=project.script, mediaitem=f"Prompt {project.pk} {j}"
+                )
+                prompt.recording.save(f"{prompt.pk}.wav", ContentFile(wave(frames)))
+            projects.append(project)
+
+        return projects
+
+    def queue(self, projects):
+        """
+        Queue an archive of `projects`, returning the mocked assembly task
+        """
+        with mock.patch("reports.tasks.chord"), mock.patch(
+            "reports.tasks.assemble_archive"
+        ) as assemble, mock.patch("reports.tasks.release_archive_lock"):
+            queue_archive(
+                projects[0].session.lower, projects[-1].session.upper, "en", "token"
+            )
+        return assemble
+
+    def test_lock_token_is_handed_to_the_tasks(self):
+        lock = mock.Mock()
+        with mock.patch("reports.tasks.archive_lock", return_value=lock), mock.patch(
+            "reports.tasks.queue_archive"
+        ) as queue:
+            create_archive(None, None, "en")
+            token = lock.acquire.call_args.kwargs["token"]
+            self.assertEqual(queue.call_args.args[3], token)
+            lock.release.assert_not_called()
+
+            queue.side_effect = OSError("Broker unavailable")
+            with self.assertRaises(OSError):
+                create_archive(None, None, "en")
+            lock.release.assert_called_once()
+
+    def test_failed_assembly_is_resumed(self):
+        projects = self.create_projects(3)
+        name, pks = self.queue(projects).si.call_args.args
+        for project in projects:
+            create_shard(name, project.pk)
+        volume_size = Shard.objects.first().filesize
+
+        calls = []
+
+        def fail_second_volume(zf, projects):
+            calls.append(projects)
+            if len(calls) == 2:
+                raise OSError("Lost connection")
+            write_description(zf, projects)
+
+        with mock.patch("reports.tasks.write_description", fail_second_volume):
+            with self.assertRaises(OSError):
+                assemble_archive(name, pks, volume_size=volume_size)
+
+        first = Archive.objects.get()
+        self.assertFalse(Project.objects.filter(archive__isnull=False).exists())
+
+        # The archive is incomplete, so it is queued again under the same name
+        assemble = self.queue(projects)
+        self.assertEqual(assemble.si.call_args.args, (name, pks))
+        self.assertTrue(assemble.si.return_value.delay.called)
+
+        assemble_archive(name, pks, volume_size=volume_size)
+
+        self.assertEqual(Archive.objects.count(), 3)
+        self.assertEqual(first.projects.count(), 1)
+        self.assertFalse(Project.objects.filter(archive__isnull=True).exists())
+        self.assertFalse(Shard.objects.exists())
+
+        for archive in Archive.objects.all():
+            with ZipFile(io.BytesIO(archive.file.read())) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertIn("DOC/Test.TXT", zf.namelist())
+
+    def build(self, projects, **options):
+        """
+        Build an archive of `projects` straight from their shards
+        """
+        name, pks = self.queue(projects).si.call_args.args
+        for project in projects:
+            create_shard(name, project.pk, **options)
+        assemble_archive(name, pks, **options)
+        return Archive.objects.get(file=name)
+
+    def test_verify_archive(self):
+        # Members of several chunks, so that reads of a shared handle interleave
+        archive = self.build(self.create_projects(2, prompts=2, frames=1024**2))
+
+        verify_archive(archive.pk, workers=4)
+        archive.refresh_from_db()
+        self.assertEqual(archive.verify_failures, [])
+
+        # Every range gets a handle of its own on local storage too
+        with tempfile.TemporaryDirectory() as root:
+            storage = FileSystemStorage(root)
+            storage.save(archive.file.name, ContentFile(archive.file.read()))
+
+            field = Archive._meta.get_field("file")
+            with mock.patch.object(field, "storage", storage):
+                verify_archive(archive.pk, workers=4)
+
+        archive.refresh_from_db()
+        self.assertEqual(archive.verify_failures, [])
+
+    def open(self, archive):
+        return ZipFile(io.BytesIO(archive.file.read()))
+
+    def test_recordings_are_copied_in_chunks(self):
+        projects = self.create_projects(2, frames=CHUNK_SIZE)
+        reads = []
+
+        class Reader(io.BytesIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return super().read(size)
+
+        def fetch(file, spool):
+            with download(file, spool) as f:
+                return Reader(f.read())
+
+        with mock.patch("reports.tasks.download", fetch):
+            archive = self.build(projects)
+
+        self.assertTrue(reads)
+        self.assertTrue(all(0 < size <= CHUNK_SIZE for size in reads))
+
+        with self.open(archive) as zf:
+            for prompt in RecPrompt.objects.all():
+                name = os.path.join(
+                    wave_dir(prompt.script.project.speaker.pk),
+                    prompt.construct_filename(),
+                )
+                self.assertEqual(zf.read(name), prompt.recording.read())
+
+    def test_prefetch_keeps_order_and_spills(self):
+        projects = self.create_projects(1, prompts=0)
+        prompts = []
+        for frames in (10000, 100, 10000, 100, 100):
+            prompt = RecPrompt.objects.create(
+                script=projects[0].script, mediaitem=f"Prompt {len(prompts)}"
+            )
+            prompt.recording.save(f"{prompt.pk}.wav", ContentFile(wave(frames)))
+            prompts.append(prompt)
+
+        finished = []
+
+        def fetch(file, spool):
+            # The first download finishes last
+            if file.instance == prompts[0]:
+                time.sleep(0.2)
+            finished.append(file.instance)
+            return download(file, spool)
+
+        # Each file gets a third of the budget in memory, as two are queued
+        # while a third is written
+        budget = 3 * 1000
+        fetched = []
+        for prompt, file in prefetch(prompts, "recording", 2, budget, fetch):
+            fetched.append((prompt, file.read(), file._rolled))
+
+        self.assertNotEqual(finished, prompts)
+        self.assertEqual([prompt for prompt, data, rolled in fetched], prompts)
+        for prompt, data, rolled in fetched:
+            self.assertEqual(data, prompt.recording.read())
+            self.assertEqual(rolled, len(data) > budget // 3)
+
+    def test_failed_shard_aborts_its_upload(self):
+        # The third recording fails after the first two have filled a part
+        projects = self.create_projects(1, prompts=3, frames=1536 * 1024)
+        fetched = []
+
+        def fetch(file, spool):
+            fetched.append(file)
+            if len(fetched) == 3:
+                raise OSError("Lost connection")
+            return download(file, spool)
+
+        s3 = boto3.client("s3", region_name=settings.AWS_S3_REGION_NAME)
+        bucket = settings.AWS_STORAGE_BUCKET_NAME
+        keys = {obj["Key"] for obj in s3.list_objects_v2(Bucket=bucket)["Contents"]}
+        uploads = []
+        _send = MultipartWriter._send
+
+        def send(part, number, data):
+            uploads.append(number)
+            return _send(part, number, data)
+
+        with self.settings(ARCHIVE_UPLOAD_PART_SIZE=5 * 1024**2), mock.patch(
+            "reports.tasks.download", fetch
+        ), mock.patch.object(MultipartWriter, "_send", staticmethod(send)):
+            with self.assertRaises(OSError):
+                create_shard("ARCHIVE/test.zip", projects[0].pk, workers=1)
+
+        self.assertEqual(uploads, [1])
+        self.assertNotIn("Uploads", s3.list_multipart_uploads(Bucket=bucket))
+        objects = s3.list_objects_v2(Bucket=bucket)["Contents"]
+        self.assertEqual({obj["Key"] for obj in objects}, keys)
+        self.assertFalse(Shard.objects.exists())
+
+    def test_members_are_indexed(self):
+        for codec, compression in (("stored", ZIP_STORED), ("deflate", ZIP_DEFLATED)):
+            with self.subTest(codec):
+                archive = self.build(self.create_projects(2), codec=codec)
+
+                with self.open(archive) as zf:
+                    infos = {info.filename: info for info in zf.infolist()}
+
+                members = archive.members.select_related("recprompt")
+                self.assertEqual(members.count(), 4)
+
+                for member in members:
+                    info = infos[member.name]
+                    self.assertEqual(
+                        (
+                            member.header_offset,
+                            member.compress_type,
+                            member.compress_size,
+                            member.file_size,
+                            member.crc,
+                        ),
+                        (
+                            info.header_offset,
+                            compression,
+                            info.compress_size,
+                            info.file_size,
+                            info.CRC,
+                        ),
+                    )
+                    self.assertEqual(
+                        b"".join(member.chunks()), member.recprompt.recording.read()
+                    )
+
+    def test_manifest(self):
+        projects = self.create_projects(2)
+        archive = self.build(projects)
+
+        expected = []
+        for project in projects:
+            speaker = project.speaker
+            for prompt in project.script.recprompts.order_by("pk"):
+                data = prompt.recording.read()
+                expected.append(
+                    {
+                        "file": os.path.join(
+                            wave_dir(speaker.pk), prompt.construct_filename()
+                        ),
+                        "speaker": speaker.pk,
+                        "sex": "F",
+                        "age": speaker.age,
+                        "accent": speaker.accent,
+                        "language": "en",
+                        "mediaitem": prompt.mediaitem,
+                        "recinstructions": prompt.get_recinstructions_display(),
+                        "filesize": len(data),
+                        "duration": 0.1,
+                        "sample_rate": 48000,
+                        "sha256": hashlib.sha256(data).hexdigest(),
+                    }
+                )
+
+        with self.open(archive) as zf:
+            text = zf.read("TABLE/MANIFEST.CSV").decode()
+            table = pq.read_table(io.BytesIO(zf.read("TABLE/MANIFEST.PARQUET")))
+
+        self.assertEqual(table.to_pylist(), expected)
+        self.assertEqual(
+            list(csv.DictReader(io.StringIO(text))),
+            [
+                {key: "" if value is None else str(value) for key, value in row.items()}
+                for row in expected
+            ],
+        )
+
+    def test_flac_codec(self):
+        # Stands in for the flac encoder, marking what it was given
+        command = [
+            sys.executable,
+            "-c",
+            "import sys; sys.stdout.buffer.write(b'fLaC' + sys.stdin.buffer.read())",
+        ]
+
+        with mock.patch("reports.tasks.FLAC_COMMAND", ["no-such-flac"]):
+            with mock.patch("reports.tasks.archive_lock") as lock:
+                with self.assertRaises(RuntimeError):
+                    create_archive(None, None, "en", codec="flac")
+            lock.assert_not_called()
+
+        for stream in (True, False):
+            with self.subTest(stream=stream), mock.patch(
+                "reports.tasks.FLAC_COMMAND", command
+            ):
+                projects = self.create_projects(1)
+                archive = self.build(projects, codec="flac", stream=stream)
+
+                with self.open(archive) as zf:
+                    rows = pq.read_table(
+                        io.BytesIO(zf.read("TABLE/MANIFEST.PARQUET"))
+                    ).to_pylist()
+
+                    for member, row in zip(
+                        archive.members.select_related("recprompt").order_by("name"),
+                        sorted(rows, key=lambda row: row["file"]),
+                    ):
+                        flac = b"fLaC" + member.recprompt.recording.read()
+                        self.assertTrue(member.name.endswith(".flac"))
+                        self.assertEqual(member.compress_type, ZIP_STORED)
+                        self.assertEqual(zf.read(member.name), flac)
+
+                        # Sizes and hashes are of the FLAC member, the
+                        # duration is read from the WAV it was encoded from
+                        self.assertEqual(row["file"], member.name)
+                        self.assertEqual(row["filesize"], len(flac))
+                        self.assertEqual(
+                            row["sha256"], hashlib.sha256(flac).hexdigest()
+                        )
+                        self.assertEqual(row["duration"], 0.1)
+
+                self.assertEqual(len(rows), 2)
+                self.assertEqual(archive.members.count(), 2)
+
+
+class RawZipWriterTest(SimpleTestCase):
+    def shard(self, members, compression):
+        """
+        A zip of `members` written to an unseekable stream, as shards are,
+        so that every member has a data descriptor
+        """
+        stream = ZipStream()
+
+        with ZipFile(stream, "w", compression) as zf:
+            for name, content in members.items():
+                with zf.open(name, "w") as file:
+                    file.write(content)
+
+        return io.BytesIO(stream.take())
+
+    def assemble(self, zip64_limit):
+        members = [
+            {"DATA/one.wav": os.urandom(1000), "DATA/twö.wav": bytes(5000)},
+            {"DATA/three.wav": b"three" * 1000, "TABLE/SPEAKER.TXT": b""},
+        ]
+        out = io.BytesIO()
+
+        with RawZipWriter(out, zip64_limit) as writer:
+            writer.copy_raw(self.shard(members[0], ZIP_STORED))
+            writer.copy_raw(self.shard(members[1], ZIP_DEFLATED))
+
+        with ZipFile(out) as zf:
+            self.assertIsNone(zf.testzip())
+            self.assertEqual(
+                [(info.filename, info.header_offset) for info in zf.infolist()],
+                [(info.filename, info.header_offset) for info in writer.infolist()],
+            )
+            for shard in members:
+                for name, content in shard.items():
+                    self.assertEqual(zf.read(name), content)
+
+            return zf.infolist()
+
+    def test_round_trip(self):
+        infos = self.assemble(ZIP64_LIMIT)
+        self.assertEqual(
+            [info.compress_type for info in infos],
+            [ZIP_STORED, ZIP_STORED, ZIP_DEFLATED, ZIP_DEFLATED],
+        )
+
+    def test_round_trip_zip64(self):
+        # Every size and offset over the limit gets a ZIP64 record
+        infos = self.assemble(0)
+        self.assertTrue(all(info.extract_version >= 45 for info in infos))
@@ -0,0 +1,208 @@
+from contextlib import contextmanager
+from django.conf import settings
+from zipfile import ZipFile, ZipInfo, ZIP64_LIMIT, ZIP_STORED
+import tempfile
+import struct
+import os
+
+CHUNK_SIZE = 1024 * 1024
+
+LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+CENTRAL_HEADER = struct.Struct("<4s6H3I5H2I")
+END_RECORD = struct.Struct("<4s4H2IH")
+END_RECORD64 = struct.Struct("<4sQ2H2I4Q")
+END_LOCATOR64 = struct.Struct("<4sIQI")
+
+# Members are copied without their data descriptors, as their CRC and sizes
+# go in the local header
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+MAX_ENTRIES = 0xFFFF
+MAX_FIELD = 0xFFFFFFFF
+
+
+def dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    year = max(year, 1980)
+    return (
+        (year - 1980) << 9 | month << 5 | day,
+        hour << 11 | minute << 5 | second // 2,
+    )
+
+
+class RawZipWriter:
+    """
+    Write a zip into an unseekable stream it owns by appending the members of
+    other zips as they are, copying the already compressed data without
+    decompressing it, and write the central directory once closed. Members
+    larger than `zip64_limit`, or stored beyond it, get ZIP64 records.
+    """
+
+    def __init__(self, out, zip64_limit=ZIP64_LIMIT):
+        self.out = out
+        self.zip64_limit = zip64_limit
+        self.position = 0
+        self.members = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not exc_type:
+            self.close()
+
+    def infolist(self):
+        return self.members
+
+    def write(self, data):
+        self.out.write(data)
+        self.position += len(data)
+
+    def copy_raw(self, source):
+        """
+        Append every member of the zip file object `source`
+        """
+        with ZipFile(source) as src:
+            infos = src.infolist()
+
+        for info in infos:
+            source.seek(info.header_offset)
+            header = source.read(LOCAL_HEADER.size)
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            source.seek(name_length + extra_length, os.SEEK_CUR)
+
+            zinfo = ZipInfo(info.filename, date_time=info.date_time)
+            zinfo.compress_type = info.compress_type
+            zinfo.flag_bits = info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+            zinfo.external_attr = info.external_attr
+            zinfo.create_system = info.create_system
+            zinfo.CRC = info.CRC
+            zinfo.compress_size = info.compress_size
+            zinfo.file_size = info.file_size
+            zinfo.header_offset = self.position
+
+            self.write_local_header(zinfo)
+            remaining = zinfo.compress_size
+
+            while remaining:
+                data = source.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    raise EOFError(f"{info.filename} is truncated")
+                self.write(data)
+                remaining -= len(data)
+
+            self.members.append(zinfo)
+
+    @contextmanager
+    def open_zip(self, compression=ZIP_STORED):
+        """
+        A ZipFile in a temporary file, whose members are appended once it is
+        closed, for members written through ZipFile's own API
+        """
+        with tempfile.TemporaryFile(dir=settings.FILE_UPLOAD_TEMP_DIR) as tmp:
+            with ZipFile(tmp, "w", compression, allowZip64=True) as zf:
+                yield zf
+
+            self.copy_raw(tmp)
+
+    def encode_name(self, zinfo):
+        try:
+            return zinfo.filename.encode("ascii"), zinfo.flag_bits
+        except UnicodeEncodeError:
+            return zinfo.filename.encode("utf-8"), zinfo.flag_bits | FLAG_UTF8
+
+    def write_local_header(self, zinfo):
+        name, flags = self.encode_name(zinfo)
+        date, time = dos_date_time(zinfo.date_time)
+        zip64 = max(zinfo.file_size, zinfo.compress_size) > self.zip64_limit
+
+        if zip64:
+            extra = struct.pack("<2H2Q", 1, 16, zinfo.file_size, zinfo.compress_size)
+            compress_size = file_size = MAX_FIELD
+        else:
+            extra = b""
+            compress_size, file_size = zinfo.compress_size, zinfo.file_size
+
+        self.write(
+            LOCAL_HEADER.pack(
+                b"PK\x03\x04",
+                45 if zip64 else 20,
+                flags,
+                zinfo.compress_type,
+                time,
+                date,
+                zinfo.CRC,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+            )
+        )
+        self.write(name)
+        self.write(extra)
+
+    def write_central_header(self, zinfo):
+        name, flags = self.encode_name(zinfo)
+        date, time = dos_date_time(zinfo.date_time)
+
+        # ZIP64 values replace the fields that do not fit, in this order
+        fields = []
+        values = []
+        for value in (zinfo.file_size, zinfo.compress_size, zinfo.header_offset):
+            if value > self.zip64_limit:
+                fields.append(value)
+                value = MAX_FIELD
+            values.append(value)
+
+        file_size, compress_size, header_offset = values
+        extra = b""
+        if fields:
+            extra = struct.pack(f"<2H{len(fields)}Q", 1, 8 * len(fields), *fields)
+
+        version = 45 if fields else 20
+        self.write(
+            CENTRAL_HEADER.pack(
+                b"PK\x01\x02",
+                version | zinfo.create_system << 8,
+                version,
+                flags,
+                zinfo.compress_type,
+                time,
+                date,
+                zinfo.CRC,
+                compress_size,
+                file_size,
+                len(name),
+                len(extra),
+                0,
+                0,
+                0,
+                zinfo.external_attr,
+                header_offset,
+            )
+        )
+        self.write(name)
+        self.write(extra)
+
+    def close(self):
+        start = self.position
+
+        for zinfo in self.members:
+            self.write_central_header(zinfo)
+
+        size = self.position - start
+        count = len(self.members)
+
+        if count > MAX_ENTRIES or start > self.zip64_limit or size > self.zip64_limit:
+            end64 = self.position
+            self.write(
+                END_RECORD64.pack(
+                    b"PK\x06\x06", 44, 45, 45, 0, 0, count, count, size, start
+                )
+            )
+            self.write(END_LOCATOR64.pack(b"PK\x06\x07", 0, end64, 1))
+            count = min(count, MAX_ENTRIES)
+            size = min(size, MAX_FIELD)
+            start = MAX_FIELD
+
+        self.write(END_RECORD.pack(b"PK\x05\x06", 0, 0, count, count, size, start, 0))
@@ -141,6 +141,35 @@ AWS_S3_REGION_NAME = env("AWS_S3_REGION_NAME")
 AWS_S3_ACCESS_KEY_ID = env("AWS_S3_ACCESS_KEY_ID")
 AWS_S3_SECRET_ACCESS_KEY = env("AWS_S3_SECRET_ACCESS_KEY")
 
+# Recording uploads, presigned or streamed to S3. All but the last part of a
+# multipart upload must be at least 5 MiB
+RECORDING_UPLOAD_PART_SIZE = env.int("RECORDING_UPLOAD_PART_SIZE", default=16 * 1024**2)
+RECORDING_UPLOAD_EXPIRY = env.int("RECORDING_UPLOAD_EXPIRY", default=60 * 60)
+RECORDING_UPLOAD_WORKERS = env.int("RECORDING_UPLOAD_WORKERS", default=2)
+RECORDING_BATCH_WORKERS = env.int("RECORDING_BATCH_WORKERS", default=8)
+# Files of a batch archive larger than this are spooled to disk
+RECORDING_BATCH_SPOOL_SIZE = env.int(
+    "RECORDING_BATCH_SPOOL_SIZE", default=int(2.5 * 1024**2)
+)
+# Resumable uploads resend at most a part, and are dropped once idle this long
+RECORDING_RESUMABLE_PART_SIZE = env.int(
+    "RECORDING_RESUMABLE_PART_SIZE", default=5 * 1024**2
+)
+RECORDING_UPLOAD_SESSION_EXPIRY = env.int(
+    "RECORDING_UPLOAD_SESSION_EXPIRY", default=24 * 60 * 60
+)
+# Enough files for a whole session's recordings in one batch upload
+DATA_UPLOAD_MAX_NUMBER_FILES = env.int("DATA_UPLOAD_MAX_NUMBER_FILES", default=1000)
+
+# Archives
+ARCHIVE_PREFETCH_WORKERS = env.int("ARCHIVE_PREFETCH_WORKERS", default=4)
+ARCHIVE_PREFETCH_MEMORY = env.int("ARCHIVE_PREFETCH_MEMORY", default=256 * 1024**2)
+# S3 allows 10,000 parts per upload, so 64 MiB parts cap an archive at 625 GiB
+ARCHIVE_UPLOAD_PART_SIZE = env.int("ARCHIVE_UPLOAD_PART_SIZE", default=64 * 1024**2)
+ARCHIVE_UPLOAD_WORKERS = env.int("ARCHIVE_UPLOAD_WORKERS", default=4)
+ARCHIVE_VERIFY_WORKERS = env.int("ARCHIVE_VERIFY_WORKERS", default=8)
+ARCHIVE_LOCK_TIMEOUT = env.int("ARCHIVE_LOCK_TIMEOUT", default=24 * 60 * 60)
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
@@ -178,6 +207,16 @@ CELERY_RESULT_BACKEND = "django-db"
 CELERY_RESULT_EXTENDED = True
 # CELERY_RESULT_EXPIRES = 432000  # 5 days
 CELERY_BROKER_URL = env("CELERY_BROKER_REDIS_URL")
+CELERY_BEAT_SCHEDULE = {
+    "Clean up upload sessions": {
+        "task": "Clean up upload sessions",
+        "schedule": 60 * 60,
+    },
+}
+
+# Rendered session bundles, kept on the broker's Redis unless configured
+BUNDLE_CACHE_URL = env("BUNDLE_CACHE_URL", default=CELERY_BROKER_URL)
+BUNDLE_CACHE_TIMEOUT = env.int("BUNDLE_CACHE_TIMEOUT", default=7 * 24 * 60 * 60)
 
 if not DEBUG:
     ROLLBAR = {